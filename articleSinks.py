@@ -0,0 +1,205 @@
+import os
+import time
+import uuid
+import pandas as pd
+
+class CsvSink:
+    """
+    Appends each scraped page to a single CSV file, writing the header only
+    when the file is new. Every write is committed immediately.
+    """
+    def __init__(self, path):
+        self.path = path
+        # An empty file (e.g. left by an interrupted first run) counts as new
+        self.file_already_exists = os.path.isfile(path) and os.path.getsize(path) > 0
+        # Appended rows must follow the header already in the file
+        self.columns = pd.read_csv(path, nrows=0).columns.tolist() if self.file_already_exists else None
+        self.warned = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, page_num, page_articles):
+        """Appends one page. Returns the page numbers now safely on disk."""
+        df_page = pd.DataFrame(page_articles)
+        if not df_page.empty:
+            if self.columns is not None:
+                dropped = df_page.columns.difference(self.columns)
+                if len(dropped) and not self.warned:
+                    print(f"[ERROR] {self.path} has no column(s) {', '.join(dropped)}; they are not written.")
+                    self.warned = True
+                df_page = df_page.reindex(columns=self.columns)
+            # Append to CSV. Only include header if file does not already exist
+            df_page.to_csv(self.path, mode='a', index=False, encoding='utf-8',
+                           header=not self.file_already_exists)
+            # After the first write, the file definitely has data
+            self.file_already_exists = True
+            self.columns = df_page.columns.tolist()
+        return [page_num]
+
+    def close(self):
+        return []
+
+    def existing_urls(self):
+        """URLs already present in the output, e.g. to seed a CrawlState."""
+        if not self.file_already_exists:
+            return []
+        return pd.read_csv(self.path, usecols=["url"])["url"].dropna().tolist()
+
+class ColumnarSink:
+    """
+    Base for the Arrow-based sinks: buffers scraped pages and writes them
+    as typed part files in a dataset directory, one file (a single row
+    group) every `rows_per_file` rows and on close.
+
+    Columns: page (int32), title, url, collection and author (dictionary
+    encoded), date (timestamp parsed from the listing, NaT if unparseable),
+    date_text (the listing's raw date), content and duplicate_of (the URL
+    of an earlier near-identical article, see nearDuplicates.py; null for
+    originals and when duplicates are not tracked). A page only counts as
+    committed once the part file holding it has been written, so write()
+    and close() return the pages that reached disk.
+    """
+    extension = None
+
+    def __init__(self, path, rows_per_file=2000):
+        self.path = path
+        self.rows_per_file = rows_per_file
+        os.makedirs(path, exist_ok=True)
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.file_seq = 0
+        self.buffer = []
+        self.buffered_pages = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def schema():
+        import pyarrow as pa
+
+        return pa.schema([
+            ("page", pa.int32()),
+            ("title", pa.string()),
+            ("url", pa.string()),
+            ("collection", pa.dictionary(pa.int32(), pa.string())),
+            ("author", pa.dictionary(pa.int32(), pa.string())),
+            ("date", pa.timestamp("s")),
+            ("date_text", pa.string()),
+            ("content", pa.string()),
+            ("duplicate_of", pa.string()),
+        ])
+
+    def write(self, page_num, page_articles):
+        """Buffers one page. Returns the page numbers now safely on disk."""
+        for article in page_articles:
+            self.buffer.append(dict(article, page=page_num))
+        self.buffered_pages.append(page_num)
+        if len(self.buffer) >= self.rows_per_file:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Writes the buffered rows as one part file. Returns the pages it committed."""
+        if self.buffer:
+            self.file_seq += 1
+            file_path = os.path.join(self.path, f"part-{self.run_id}-{self.file_seq:05d}.{self.extension}")
+            tmp_path = f"{file_path}.tmp"
+            self.write_table(self.to_table(self.buffer), tmp_path)
+            os.replace(tmp_path, file_path)  # readers never see a half-written part
+        committed = self.buffered_pages
+        self.buffer = []
+        self.buffered_pages = []
+        return committed
+
+    def close(self):
+        return self.flush()
+
+    def to_table(self, rows):
+        import pyarrow as pa
+
+        columns = {name: [row.get(name) for row in rows]
+                   for name in ("page", "title", "url", "collection", "author", "content", "duplicate_of")}
+        date_text = [row.get("date") for row in rows]
+        columns["date_text"] = date_text
+        schema = self.schema()
+        # From the Series, so NaT becomes null rather than a Timestamp-like value
+        columns["date"] = pa.Array.from_pandas(parse_listing_dates(date_text), type=schema.field("date").type)
+        return pa.Table.from_pydict({name: columns[name] for name in schema.names}, schema=schema)
+
+    def write_table(self, table, file_path):
+        raise NotImplementedError
+
+    def existing_urls(self):
+        """URLs already present in the output, e.g. to seed a CrawlState."""
+        return read_articles(self.path, columns=["url"])["url"].dropna().tolist()
+
+class ParquetSink(ColumnarSink):
+    """Writes scraped articles as a directory of zstd-compressed Parquet part files."""
+    extension = "parquet"
+
+    def write_table(self, table, file_path):
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, file_path, compression="zstd", use_dictionary=True)
+
+class ArrowSink(ColumnarSink):
+    """Writes scraped articles as a directory of Arrow IPC files, readable memory-mapped."""
+    extension = "arrow"
+
+    def write_table(self, table, file_path):
+        import pyarrow as pa
+
+        with pa.OSFile(file_path, "wb") as f:
+            with pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+
+def parse_listing_dates(date_text):
+    """
+    Parses listing dates into a datetime64 Series, to the second (NaT where
+    missing or unparseable). ISO dates are read as such, anything else
+    day-first as on the UK site.
+    """
+    raw = pd.Series(date_text, dtype="object")
+    parsed = pd.to_datetime(raw, errors="coerce", format="ISO8601")
+    missing = parsed.isna() & raw.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(raw[missing], errors="coerce", dayfirst=True, format="mixed")
+    return parsed.dt.floor("s")
+
+def make_sink(path, rows_per_file=2000):
+    """Picks the sink from the output path: *.csv, *.parquet or *.arrow."""
+    if path.endswith(".csv"):
+        return CsvSink(path)
+    if path.endswith(".parquet"):
+        return ParquetSink(path, rows_per_file)
+    if path.endswith(".arrow"):
+        return ArrowSink(path, rows_per_file)
+    raise ValueError(f"Cannot infer the output format of {path!r}; expected .csv, .parquet or .arrow")
+
+def read_articles(path, columns=None):
+    """
+    Loads scraped articles written by any sink into a DataFrame, reading
+    only `columns` if given. Parquet and Arrow outputs are memory-mapped;
+    columns added to the schema later (duplicate_of) read as null from
+    older part files.
+    """
+    if path.endswith(".csv"):
+        return pd.read_csv(path, usecols=columns)
+
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    file_format, extension = ("parquet", ".parquet") if path.endswith(".parquet") else ("ipc", ".arrow")
+    files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(extension))
+    if not files:
+        return pd.DataFrame(columns=columns or ColumnarSink.schema().names)
+    dataset = ds.dataset(files, format=file_format, schema=ColumnarSink.schema(),
+                         filesystem=fs.LocalFileSystem(use_mmap=True))
+    return dataset.to_table(columns=columns).to_pandas()
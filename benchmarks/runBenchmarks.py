@@ -0,0 +1,436 @@
+"""
+Offline throughput benchmarks for the scrape, clean, NER and optimise stages.
+
+Every input is generated locally from a fixed seed: Morningstar-like listing
+and article HTML served by a stand-in HTTP server on 127.0.0.1, synthetic
+transcripts with a recurring disclaimer and named entities, and synthetic
+alpha panels. Each stage is timed at the requested scales and the results
+are written as JSON, so two runs (e.g. before and after a change) can be
+compared entry by entry. A stage whose dependency is missing (aiohttp,
+lxml, spaCy or its model, a MOSEK licence, ...) is recorded as skipped
+rather than failing the run.
+
+Usage:
+    python benchmarks/runBenchmarks.py --scales small medium --output before.json
+    python benchmarks/runBenchmarks.py --stages optimise --scales large --repeat 5
+"""
+import argparse
+import contextlib
+import http.server
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "clean"), os.path.join(ROOT, "portfolioConstruction")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+STAGES = ("scrape", "merge", "clean", "ner", "optimise")
+
+SCALES = {
+    "small": {"pages": 2, "documents": 200, "merge_documents": 100, "ner_documents": 50, "symbols": 200,
+              "dates": 20},
+    "medium": {"pages": 10, "documents": 1000, "merge_documents": 500, "ner_documents": 200, "symbols": 1000,
+               "dates": 50},
+    "large": {"pages": 40, "documents": 5000, "merge_documents": 2000, "ner_documents": 1000, "symbols": 3000,
+              "dates": 100},
+}
+
+ARTICLES_PER_PAGE = 20
+LISTING_PATH = "/uk/collection/2110/2310/equity-research--insights.aspx"
+
+WORDS = (
+    "revenue margin guidance quarter growth demand pricing capital dividend cash flow "
+    "valuation outlook investors shares market earnings cost inflation rates segment "
+    "customers supply chain competition strategy pipeline consumer cloud software retail "
+    "energy bank credit portfolio forecast risk return analyst estimate fair value moat"
+).split()
+
+COMPANIES = ("Apple", "Microsoft", "Unilever", "Shell", "Barclays", "Tesco", "Nvidia", "Diageo")
+PEOPLE = ("Tim Cook", "Satya Nadella", "Alan Jope", "Wael Sawan", "Ken Murphy", "Jensen Huang")
+PRODUCTS = ("iPhone", "Azure", "Dove", "Xbox", "GeForce", "Guinness")
+
+DISCLAIMER = (
+    "This article contains forward looking statements which are subject to risks and "
+    "uncertainties and actual results may differ materially from those expressed or implied "
+    "and past performance is not a reliable indicator of future results so please read the "
+    "terms of use and the full disclosure before making any investment decision"
+)
+
+# ---------------------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------------------
+
+def sentence(rng, entities=True):
+    words = rng.choices(WORDS, k=rng.randint(8, 20))
+    if entities and rng.random() < 0.5:
+        words.insert(rng.randrange(len(words)), rng.choice(COMPANIES + PEOPLE + PRODUCTS))
+    return " ".join(words).capitalize() + "."
+
+def transcript(rng, sentences=40, entities=True):
+    """A synthetic transcript: random sentences with the disclaimer, lightly varied, in the middle."""
+    body = [sentence(rng, entities) for _ in range(sentences)]
+    disclaimer = DISCLAIMER.split()
+    if rng.random() < 0.3:
+        del disclaimer[rng.randrange(len(disclaimer))]
+    body.insert(rng.randrange(len(body) + 1), " ".join(disclaimer) + ".")
+    return " ".join(body)
+
+def transcripts(count, seed, sentences=40, entities=True):
+    rng = random.Random(seed)
+    return [transcript(rng, sentences, entities) for _ in range(count)]
+
+def listing_html(page_number, seed):
+    rng = random.Random(f"{seed}-listing-{page_number}")
+    rows = []
+    for k in range(ARTICLES_PER_PAGE):
+        article_id = page_number * ARTICLES_PER_PAGE + k
+        title = " ".join(rng.choices(WORDS, k=6)).title()
+        rows.append(
+            f"<tr><td><a href=\"/uk/news/{article_id}/{title.lower().replace(' ', '-')}.aspx\">{title}</a></td>"
+            f"<td>Stock Analysis</td><td>{rng.choice(PEOPLE)}</td>"
+            f"<td>{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024</td></tr>"
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Equity Research &amp; Insights</title>"
+        "<script>var tracking = {page: 1};</script></head><body>"
+        "<nav><ul><li><a href='/uk/'>Home</a></li><li><a href='/uk/news/'>News</a></li></ul></nav>"
+        "<table class='mdc-table'><thead><tr><th>Title</th><th>Collection</th><th>Author</th>"
+        f"<th>Date</th></tr></thead><tbody>{''.join(rows)}</tbody></table>"
+        "<footer><p>&copy; Morningstar</p></footer></body></html>"
+    )
+
+def article_html(article_id, seed):
+    rng = random.Random(f"{seed}-article-{article_id}")
+    paragraphs = "".join(f"<p>{sentence(rng)} {sentence(rng)} <b>{sentence(rng)}</b></p>" for _ in range(12))
+    return (
+        "<!DOCTYPE html><html><head><title>Article</title><style>p {margin: 0}</style></head><body>"
+        "<nav><a href='/uk/'>Home</a></nav><article><h1>Research note</h1>"
+        f"{paragraphs}<p> </p><p>{DISCLAIMER}</p></article>"
+        "<script>window.ads = [];</script></body></html>"
+    )
+
+class FixtureSite:
+    """
+    Stand-in for the Morningstar site on a local port: serves generated
+    listing pages at the real listing path and the articles they link to.
+    """
+    def __init__(self, seed):
+        site = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, Nagle plus
+            # delayed ACKs add ~40 ms to every keep-alive request
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == LISTING_PATH:
+                    page_number = int(parse_qs(url.query).get("page", ["1"])[0])
+                    body = listing_html(page_number, site.seed)
+                elif url.path.startswith("/uk/news/"):
+                    body = article_html(int(url.path.split("/")[3]), site.seed)
+                else:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                payload = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.seed = seed
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def listing_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}{LISTING_PATH}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def alpha_panel(dates, symbols, seed):
+    """Synthetic alphas: a few common factors plus noise, with symbols listing and delisting."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    loadings = rng.normal(size=(symbols, 5))
+    values = rng.normal(size=(dates, 5)) @ loadings.T + rng.normal(size=(dates, symbols)) * rng.lognormal(size=symbols)
+    listed = rng.integers(-dates // 2, dates // 4, size=symbols)
+    delisted = rng.integers(dates, 2 * dates, size=symbols)
+    rows = np.arange(dates)[:, None]
+    values[(rows < listed) | (rows >= delisted)] = np.nan
+    return pd.DataFrame(values, index=pd.bdate_range("2015-01-01", periods=dates),
+                        columns=[f"SYM{j:05d}" for j in range(symbols)])
+
+# ---------------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------------
+
+def measure(stage, variant, scale, items, repeat, run, setup=None, **params):
+    """
+    Times `run` (after `setup`, untimed, if given) `repeat` times and returns
+    the result entry; the best time is what comparisons should use.
+    """
+    seconds = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(state) if setup is not None else run()
+            seconds.append(time.perf_counter() - start)
+    best = min(seconds)
+    print(f"  {stage:<9} {variant:<28} {scale:<7} {best * 1000:10.1f} ms  {items / best:12.1f} items/s")
+    return {
+        "stage": stage, "variant": variant, "scale": scale, "params": params, "items": items,
+        "seconds": seconds, "best_seconds": best, "items_per_second": items / best,
+    }
+
+def skipped(stage, variant, scale, reason):
+    print(f"  {stage:<9} {variant:<28} {scale:<7} skipped: {reason}")
+    return {"stage": stage, "variant": variant, "scale": scale, "skipped": reason}
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+def bench_scrape(scale, params, repeat, seed, workdir):
+    try:
+        import scrapeMorningStar
+    except ImportError as e:
+        return [skipped("scrape", "*", scale, f"import failed: {e}")]
+
+    pages = params["pages"]
+    items = pages * ARTICLES_PER_PAGE
+    variants = [("sync html.parser", False, "html.parser", None),
+                ("sync lxml", False, "lxml", "lxml"),
+                ("async lxml", True, "lxml", "aiohttp")]
+    results = []
+    with FixtureSite(seed) as site:
+        original_url = scrapeMorningStar.LISTING_URL
+        scrapeMorningStar.LISTING_URL = site.listing_url
+        try:
+            for variant, use_async, parser, dependency in variants:
+                if dependency is not None:
+                    try:
+                        __import__(dependency)
+                    except ImportError:
+                        results.append(skipped("scrape", variant, scale, f"{dependency} is not installed"))
+                        continue
+
+                def setup():
+                    return tempfile.mkdtemp(dir=workdir)
+
+                def run(output_dir, use_async=use_async, parser=parser):
+                    scrapeMorningStar.scrape_and_append_to_csv(
+                        start_page=1, end_page=pages, csv_filename=os.path.join(output_dir, "articles.csv"),
+                        use_async=use_async, concurrency=16, requests_per_second=1000.0, parser=parser
+                    )
+
+                results.append(measure("scrape", variant, scale, items, repeat, run, setup,
+                                       pages=pages, articles_per_page=ARTICLES_PER_PAGE))
+        finally:
+            scrapeMorningStar.LISTING_URL = original_url
+    return results
+
+def bench_merge(scale, params, repeat, seed, workdir):
+    try:
+        from textCleaning import textCleaning
+    except ImportError as e:
+        return [skipped("merge", "merge_most_frequent", scale, f"import failed: {e}")]
+
+    documents = transcripts(params["merge_documents"], seed)
+    processor = textCleaning(num_merges=1000, top_n=5, similarity_threshold=0.95)
+    return [measure("merge", "merge_most_frequent", scale, len(documents), repeat,
+                    lambda: processor.merge_most_frequent(documents),
+                    documents=len(documents), num_merges=processor.num_merges)]
+
+def bench_clean(scale, params, repeat, seed, workdir):
+    try:
+        from textCleaning import textCleaning
+    except ImportError as e:
+        return [skipped("clean", "*", scale, f"import failed: {e}")]
+
+    documents = transcripts(params["documents"], seed)
+    processor = textCleaning(num_merges=1000, top_n=5, similarity_threshold=0.95)
+    phrases = processor.merge_most_frequent(documents[1:100])
+    workers = os.cpu_count() or 1
+    results = []
+    for backend in ("inline", "threads", "processes"):
+        results.append(measure(
+            "clean", f"process_documents {backend}", scale, len(documents), repeat,
+            lambda backend=backend: processor.process_documents_with_logging(
+                documents, phrases, num_threads=workers, backend=backend
+            ),
+            documents=len(documents), phrases=len(phrases), workers=workers
+        ))
+    return results
+
+def bench_ner(scale, params, repeat, seed, workdir, spacy_model="en_core_web_sm"):
+    try:
+        import cleanNER
+        cleanNER.init_spacy(spacy_model)
+    except (ImportError, OSError) as e:
+        return [skipped("ner", "*", scale, f"spaCy model {spacy_model!r} unavailable: {e}")]
+
+    documents = transcripts(params["ner_documents"], seed, sentences=15)
+    return [
+        measure("ner", "mask_entities", scale, len(documents), repeat,
+                lambda: [cleanNER.mask_entities(text) for text in documents],
+                documents=len(documents), model=spacy_model),
+        measure("ner", "mask_entities_batch", scale, len(documents), repeat,
+                lambda: cleanNER.mask_entities_batch(documents),
+                documents=len(documents), model=spacy_model),
+    ]
+
+def mosek_available():
+    import numpy as np
+    from portCon import Optimizer
+
+    try:
+        with Optimizer(solver="mosek") as probe:
+            probe.solve(np.array([1.0, -1.0]), np.ones(2))
+        return None
+    except Exception as e:  # no package, no licence, ...
+        return f"MOSEK unavailable: {str(e).splitlines()[0] if str(e) else type(e).__name__}"
+
+def bench_optimise(scale, params, repeat, seed, workdir):
+    try:
+        from portCon import Optimizer, RollingCovariance
+    except ImportError as e:
+        return [skipped("optimise", "*", scale, f"import failed: {e}")]
+
+    symbols, dates = params["symbols"], params["dates"]
+    optimizer = Optimizer(solver="diagonal")
+    panel = alpha_panel(optimizer.lookback_cov + dates, symbols, seed)
+    all_dates = list(panel.index)
+    positions = range(optimizer.lookback_cov, len(all_dates))
+    workers = os.cpu_count() or 1
+    common = {"symbols": symbols, "dates": dates, "lookback": optimizer.lookback_cov}
+
+    def loop(opt, engine_mode=None):
+        engine = RollingCovariance(panel, opt.lookback_cov, mode=engine_mode) if engine_mode else None
+        for i in positions:
+            opt.optimise(all_dates, i, panel, engine=engine)
+
+    results = [
+        measure("optimise", "optimise diagonal", scale, dates, repeat, lambda: loop(optimizer), **common),
+        measure("optimise", "optimise diagonal + engine", scale, dates, repeat,
+                lambda: loop(optimizer, "diagonal"), **common),
+        measure("optimise", "backtest diagonal", scale, dates, repeat,
+                lambda: optimizer.backtest(panel, num_workers=1), workers=1, **common),
+    ]
+    if workers > 1:
+        results.append(measure("optimise", f"backtest diagonal x{workers}", scale, dates, repeat,
+                               lambda: optimizer.backtest(panel, num_workers=workers), workers=workers, **common))
+
+    reason = mosek_available()
+    for variant, options in (("optimise mosek", {}), ("optimise mosek factor", {"risk_model": "factor"})):
+        if reason is not None:
+            results.append(skipped("optimise", variant, scale, reason))
+            continue
+        with Optimizer(solver="mosek", **options) as mosek_optimizer:
+            results.append(measure("optimise", variant, scale, dates, repeat,
+                                   lambda: loop(mosek_optimizer, "diagonal" if not options else None),
+                                   **common, **options))
+    return results
+
+BENCHMARKS = {
+    "scrape": bench_scrape,
+    "merge": bench_merge,
+    "clean": bench_clean,
+    "ner": bench_ner,
+    "optimise": bench_optimise,
+}
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def environment():
+    """Machine and library versions recorded with every run."""
+    versions = {}
+    for name in ("numpy", "pandas", "pyarrow", "bs4", "lxml", "aiohttp", "requests", "spacy", "mosek"):
+        try:
+            module = __import__(name)
+            versions[name] = getattr(module, "__version__", None) or ".".join(map(str, module.Env.getversion()))
+        except Exception:
+            versions[name] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+    }
+
+def run_benchmarks(stages=STAGES, scales=("small",), repeat=3, seed=0, spacy_model="en_core_web_sm"):
+    """Runs the selected stages at the selected scales and returns the JSON-ready report."""
+    # The cleaning code logs per chunk and merge (and configures logging on
+    # import); keep the timings free of log formatting
+    logging.disable(logging.INFO)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in scales:
+            print(f"Scale {scale}: {SCALES[scale]}")
+            for stage in stages:
+                options = {"spacy_model": spacy_model} if stage == "ner" else {}
+                try:
+                    results.extend(BENCHMARKS[stage](scale, SCALES[scale], repeat, seed, workdir, **options))
+                except Exception as e:
+                    print(f"[ERROR] Benchmark {stage} failed at scale {scale}: {e}")
+                    results.append({"stage": stage, "variant": "*", "scale": scale, "error": repr(e)})
+    return {
+        "meta": dict(environment(), seed=seed, repeat=repeat, scales={scale: SCALES[scale] for scale in scales}),
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark; the best is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spacy-model", default="en_core_web_sm")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.stages, args.scales, args.repeat, args.seed, args.spacy_model)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(report['results'])} result(s) to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -2,62 +2,406 @@ import pandas as pd
 import spacy
 import re
 import pickle
-import multiprocessing
-from multiprocessing import Pool, Manager, cpu_count
+import hashlib
+import sqlite3
+import struct
+import threading
+import time
+from collections import deque
+from multiprocessing import Pool, cpu_count
 
-def init_spacy():
+MASK_LABELS = ("ORG", "PERSON", "PRODUCT")
+
+# Pipes the entity recognizer does not depend on; skipping them speeds up every document
+DISABLED_PIPES = ["parser", "lemmatizer"]
+
+def init_spacy(model="en_core_web_sm", disable=DISABLED_PIPES):
     """Initialize spaCy model inside each worker process"""
     global nlp
-    nlp = spacy.load("en_core_web_sm")  # Load inside worker
+    nlp = spacy.load(model, disable=disable)  # Load inside worker
+
+def entity_spans(doc):
+    """(start_char, end_char, label) of every entity in a spaCy Doc."""
+    return [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
+
+def mask_spans(text, spans, labels=MASK_LABELS, all_occurrences=False):
+    """
+    Replaces the entities in `spans` whose label is in `labels` with "[LABEL]".
+
+    By default the masked text is rebuilt in one pass from the character
+    offsets, so only the recognised spans are masked. all_occurrences=True
+    keeps the original behaviour: every whole-word occurrence of each
+    entity's text is masked, entity by entity.
+    """
+    if all_occurrences:
+        masked_text = text
+        for start, end, label in spans:
+            if label in labels:
+                masked_text = re.sub(r'\b' + re.escape(text[start:end]) + r'\b', f'[{label}]', masked_text)
+        return masked_text
 
-def mask_entities(text):
+    pieces = []
+    position = 0
+    for start, end, label in spans:
+        if label in labels and start >= position:
+            pieces.append(text[position:start])
+            pieces.append(f'[{label}]')
+            position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+def mask_entities(text, labels=MASK_LABELS, all_occurrences=False):
     """Mask organization, person, and product names in a text."""
     doc = nlp(text)  # Uses process-local nlp instance
-    masked_text = text
-    for ent in doc.ents:
-        if ent.label_ in ["ORG", "PERSON", "PRODUCT"]:
-            masked_text = re.sub(r'\b' + re.escape(ent.text) + r'\b', f'[{ent.label_}]', masked_text)
-    return masked_text
+    return mask_spans(text, entity_spans(doc), labels, all_occurrences)
 
-def process_chunk(chunk, progress, total_chunks, lock):
-    """Process a chunk of the DataFrame while logging progress."""
-    chunk["transcript"] = chunk["transcript"].apply(mask_entities)
+def model_key(model):
+    """
+    Identifies a spaCy model as "lang_name-version", from a loaded pipeline
+    or from the meta.json of a package name / model directory.
+    """
+    if isinstance(model, str):
+        path = spacy.util.get_package_path(model) if spacy.util.is_package(model) else model
+        meta = spacy.util.get_model_meta(path)
+    else:
+        meta = model.meta
+    return f"{meta['lang']}_{meta['name']}-{meta['version']}"
 
-    # Log progress safely
-    with lock:
-        progress.value += 1
-        print(f"Processed chunk {progress.value}/{total_chunks} ({(progress.value / total_chunks) * 100:.2f}%)")
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
 
-    return chunk
+class EntitySpanCache:
+    """
+    Persistent cache of the entity spans spaCy found in each text, keyed by
+    a hash of the text and the model (see model_key).
 
-if __name__ == '__main__':
-    # Load the dataset
-    with open('/Users/lichenhui/Desktop/MorningStarNLP1/MorningStarNLP/EarningsCall/motley-fool-data.pkl', 'rb') as file:
-        data = pickle.load(file)
+    All entity labels are stored, not only the masked ones, so masking with
+    another label set or replacement scheme reuses the cache and only new
+    or changed texts reach the model. Spans are packed as little-endian
+    uint32 (start, end, label id) triples in a SQLite file. The connection
+    is shared between threads under a lock.
+
+    `model` is the model's model_key().
+    """
+    def __init__(self, path, model):
+        self.path = path
+        self.model = model
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS labels (
+                id INTEGER PRIMARY KEY,
+                label TEXT UNIQUE NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS spans (
+                model TEXT NOT NULL,
+                text_hash BLOB NOT NULL,
+                spans BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID;
+            """
+        )
+        self.conn.commit()
+        self.label_ids = {label: id_ for id_, label in self.conn.execute("SELECT id, label FROM labels")}
+        self.labels = {id_: label for label, id_ in self.label_ids.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, hashes):
+        """Returns {text hash: spans} for the hashes that are cached."""
+        found = {}
+        hashes = list(hashes)
+        with self.lock:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT text_hash, spans FROM spans WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [self.model, *chunk]
+                )
+                for hash_, packed in rows:
+                    found[hash_] = self._unpack(packed)
+        return found
+
+    def put_many(self, items):
+        """Stores (text hash, spans) pairs."""
+        with self.lock, self.conn:
+            rows = [(self.model, hash_, self._pack(spans)) for hash_, spans in items]
+            self.conn.executemany("INSERT OR REPLACE INTO spans (model, text_hash, spans) VALUES (?, ?, ?)", rows)
+
+    def _label_id(self, label):
+        id_ = self.label_ids.get(label)
+        if id_ is None:
+            id_ = self.conn.execute("INSERT INTO labels (label) VALUES (?)", (label,)).lastrowid
+            self.label_ids[label] = id_
+            self.labels[id_] = label
+        return id_
+
+    def _pack(self, spans):
+        flat = [value for start, end, label in spans for value in (start, end, self._label_id(label))]
+        return struct.pack(f"<{len(flat)}I", *flat)
+
+    def _unpack(self, packed):
+        flat = struct.unpack(f"<{len(packed) // 4}I", packed)
+        return [(flat[i], flat[i + 1], self.labels[flat[i + 2]]) for i in range(0, len(flat), 3)]
+
+def cached_entity_spans(texts, span_cache=None, batch_size=64, metrics=None):
+    """
+    Entity spans for each text, using `span_cache` (an EntitySpanCache) when
+    given so that only uncached texts go through nlp.pipe. `metrics` (a
+    PipelineMetrics) records the time spent in the model, the texts it ran
+    on and the cache hits.
+    """
+    texts = list(texts)
+    start = time.perf_counter()
+    if span_cache is None:
+        spans = [entity_spans(doc) for doc in nlp.pipe(texts, batch_size=batch_size)]
+        if metrics is not None:
+            metrics.observe("ner_model_seconds", time.perf_counter() - start)
+            metrics.inc("ner_model_documents_total", len(texts))
+        return spans
+
+    hashes = [text_hash(text) for text in texts]
+    cached = span_cache.get_many(hashes)
+    misses = [i for i, hash_ in enumerate(hashes) if hash_ not in cached]
+    if metrics is not None:
+        metrics.inc("ner_cache_hits_total", len(texts) - len(misses))
+    if misses:
+        start = time.perf_counter()
+        docs = nlp.pipe((texts[i] for i in misses), batch_size=batch_size)
+        new_spans = {hashes[i]: entity_spans(doc) for i, doc in zip(misses, docs)}
+        if metrics is not None:
+            metrics.observe("ner_model_seconds", time.perf_counter() - start)
+            metrics.inc("ner_model_documents_total", len(misses))
+        span_cache.put_many(new_spans.items())
+        cached.update(new_spans)
+    return [cached[hash_] for hash_ in hashes]
+
+def mask_entities_batch(texts, batch_size=64, labels=MASK_LABELS, all_occurrences=False, span_cache=None,
+                        metrics=None):
+    """
+    Batched mask_entities: runs the texts through nlp.pipe `batch_size`
+    at a time and returns the masked texts in input order. With a
+    `span_cache`, texts seen before by the same model skip spaCy entirely.
+    `metrics` is an optional PipelineMetrics (see record_masked).
+    """
+    texts = list(texts)
+    spans = cached_entity_spans(texts, span_cache, batch_size, metrics)
+    masked = [mask_spans(text, text_spans, labels, all_occurrences) for text, text_spans in zip(texts, spans)]
+    if metrics is not None:
+        record_masked(metrics, texts, spans, labels)
+    return masked
 
-    print(f"Loaded {len(data)} rows.")
+def record_masked(metrics, texts, spans, labels=MASK_LABELS):
+    """Counts the documents, characters and masked entities (per label) of a batch."""
+    metrics.inc("ner_documents_total", len(texts))
+    metrics.inc("ner_chars_total", sum(len(text) for text in texts if isinstance(text, str)))
+    masked = {}
+    for text_spans in spans:
+        for _, _, label in text_spans:
+            if label in labels:
+                masked[label] = masked.get(label, 0) + 1
+    for label, count in masked.items():
+        metrics.inc("ner_entities_masked_total", count, label=label)
 
-    # Split the DataFrame into chunks for multiprocessing
-    num_workers = min(cpu_count(), 8)  # Use up to 8 CPU cores
-    chunk_size = len(data) // num_workers
-    chunks = [data.iloc[i:i + chunk_size].copy() for i in range(0, len(data), chunk_size)]
-    total_chunks = len(chunks)
+def extract_spans_batch(texts, batch_size=64):
+    """
+    Worker task: runs one batch of texts through the process-local model
+    and returns the entity spans of each text, and the seconds it took.
+    Non-string values (e.g. missing transcripts) get no spans.
+    """
+    start = time.perf_counter()
+    docs = nlp.pipe((text if isinstance(text, str) else "" for text in texts), batch_size=batch_size)
+    return [entity_spans(doc) for doc in docs], time.perf_counter() - start
 
-    print(f"Processing {total_chunks} chunks using {num_workers} CPU cores.")
+def iter_row_batches(path, batch_rows=256):
+    """
+    Yields the rows of a .csv, .parquet (file or dataset directory) or
+    pickled DataFrame in DataFrames of at most `batch_rows` rows. CSV and
+    Parquet inputs are read incrementally; a pickle has to be loaded whole,
+    but its batches are slices rather than copies.
+    """
+    if path.endswith(".csv"):
+        yield from pd.read_csv(path, chunksize=batch_rows)
+    elif path.endswith(".parquet"):
+        import pyarrow.dataset as ds
 
-    # Use multiprocessing manager to track progress
-    with Manager() as manager:
-        progress = manager.Value('i', 0)  # Shared counter
-        lock = manager.Lock()  # Lock to prevent race conditions
+        for batch in ds.dataset(path, format="parquet").to_batches(batch_size=batch_rows):
+            if batch.num_rows:
+                yield batch.to_pandas()
+    else:
+        with open(path, 'rb') as file:
+            data = pickle.load(file)
+        print(f"Loaded {len(data)} rows.")
+        for start in range(0, len(data), batch_rows):
+            yield data.iloc[start:start + batch_rows]
 
-        # Use multiprocessing pool to process chunks in parallel
-        with Pool(num_workers, initializer=init_spacy) as pool:
-            results = pool.starmap(process_chunk, [(chunk, progress, total_chunks, lock) for chunk in chunks])
+class MaskedOutputWriter:
+    """
+    Appends masked row batches to a Parquet file (or a CSV file if the path
+    ends in .csv) as they arrive.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.wrote_csv_header = False
+
+    def write(self, batch):
+        if self.path.endswith(".csv"):
+            batch.to_csv(self.path, mode='w' if not self.wrote_csv_header else 'a',
+                         index=False, header=not self.wrote_csv_header)
+            self.wrote_csv_header = True
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(batch, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, self.output_schema(batch, table.schema), compression="zstd")
+        if not table.schema.equals(self.writer.schema):
+            # Batch-wise type inference can differ, e.g. an all-missing column in one CSV chunk
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    @staticmethod
+    def output_schema(batch, schema):
+        """
+        The schema of the first batch, with its all-missing columns (typed
+        null, or double when read from CSV) widened to string, so that later
+        batches holding text, or numbers, can still be cast to it.
+        """
+        import pyarrow as pa
+
+        return pa.schema([field.with_type(pa.string()) if batch[field.name].isna().all() else field
+                          for field in schema], metadata=schema.metadata)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def stream_mask_file(input_path, output_path, column="transcript", batch_rows=256, num_workers=None,
+                     max_pending=None, labels=MASK_LABELS, all_occurrences=False,
+                     model="en_core_web_sm", report_every=10.0, span_cache_path=None, metrics=None):
+    """
+    Masks entities in one column of a large file without loading it whole.
+
+    Row batches from iter_row_batches are handed to a worker pool with
+    apply_async, one batch per task, so idle workers pick up the next batch
+    as soon as they finish instead of waiting on a fixed chunk. Workers only
+    receive the column's texts and only return entity spans; masking and
+    writing happen here, in input order, batch by batch (MaskedOutputWriter).
+    At most `max_pending` batches (default 2 * num_workers) are in flight,
+    which bounds memory. Throughput in docs/sec is printed every
+    `report_every` seconds.
+
+    With `span_cache_path`, an EntitySpanCache for `model` is consulted
+    before dispatching each batch: only texts it does not know are sent to
+    the workers, and their spans are added to it.
+
+    `metrics` is an optional PipelineMetrics; the model time measured in
+    each worker is recorded here per batch, along with cache hits, masked
+    entity counts and write times.
+    """
+    num_workers = num_workers or min(cpu_count(), 8)  # Use up to 8 CPU cores
+    max_pending = max_pending or 2 * num_workers
+    span_cache = EntitySpanCache(span_cache_path, model_key(model)) if span_cache_path else None
+
+    def texts_to_mask(batch):
+        """(batch, text hashes, cached spans) and the texts the workers still have to run."""
+        texts = batch[column].tolist()
+        if span_cache is None:
+            return (batch, None, None), texts
+        hashes = [text_hash(text) if isinstance(text, str) else None for text in texts]
+        cached = span_cache.get_many(hash_ for hash_ in hashes if hash_ is not None)
+        return (batch, hashes, cached), [text for text, hash_ in zip(texts, hashes)
+                                         if hash_ is not None and hash_ not in cached]
+
+    def batch_results(pool):
+        # Submitting from this thread, only after a batch is written, keeps the backpressure
+        # out of the pool's own threads, so an error here can always terminate the pool
+        pending = deque()
+        for batch in iter_row_batches(input_path, batch_rows):
+            prepared, texts = texts_to_mask(batch)
+            pending.append((prepared, pool.apply_async(extract_spans_batch, (texts,))))
+            if len(pending) >= max_pending:
+                prepared, result = pending.popleft()
+                yield prepared, result.get()
+        while pending:
+            prepared, result = pending.popleft()
+            yield prepared, result.get()
+
+    writer = MaskedOutputWriter(output_path)
+    done = 0
+    started = last_report = time.monotonic()
+    print(f"Masking {input_path} with {num_workers} worker(s), {batch_rows} rows per batch.")
+    try:
+        with Pool(num_workers, initializer=init_spacy, initargs=(model,)) as pool:
+            for (batch, hashes, cached), (spans, model_seconds) in batch_results(pool):
+                if metrics is not None:
+                    metrics.observe("ner_model_seconds", model_seconds)
+                    metrics.inc("ner_model_documents_total", len(spans))
+                    if cached is not None:
+                        metrics.inc("ner_cache_hits_total", len(cached))
+
+                if span_cache is not None:
+                    new_spans = iter(spans)
+                    spans = []
+                    fresh = []
+                    for hash_ in hashes:
+                        if hash_ is None:
+                            spans.append([])
+                        elif hash_ in cached:
+                            spans.append(cached[hash_])
+                        else:
+                            spans.append(next(new_spans))
+                            fresh.append((hash_, spans[-1]))
+                    span_cache.put_many(fresh)
+
+                texts = batch[column].tolist()
+                masked = [mask_spans(text, text_spans, labels, all_occurrences) if isinstance(text, str) else text
+                          for text, text_spans in zip(texts, spans)]
+                if metrics is None:
+                    writer.write(batch.assign(**{column: masked}))
+                else:
+                    record_masked(metrics, texts, spans, labels)
+                    with metrics.timer("ner_write_seconds"):
+                        writer.write(batch.assign(**{column: masked}))
+
+                done += len(batch)
+                now = time.monotonic()
+                if now - last_report >= report_every:
+                    print(f"Masked {done} docs ({done / (now - started):.1f} docs/sec)")
+                    last_report = now
+    finally:
+        writer.close()
+        if span_cache is not None:
+            span_cache.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Saved {done} masked rows to {output_path} in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.1f} docs/sec)")
+    return done
+
+if __name__ == '__main__':
+    import argparse
 
-    # Combine results
-    data = pd.concat(results, ignore_index=True)
+    parser = argparse.ArgumentParser(description="Mask ORG / PERSON / PRODUCT entities in transcripts.")
+    parser.add_argument("input", nargs="?",
+                        default='/Users/lichenhui/Desktop/MorningStarNLP1/MorningStarNLP/EarningsCall/motley-fool-data.pkl',
+                        help="pickled DataFrame, .csv or .parquet")
+    parser.add_argument("output", nargs="?", default="masked_transcripts.parquet", help=".parquet or .csv")
+    parser.add_argument("--column", default="transcript")
+    parser.add_argument("--batch-rows", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--span-cache", default=None, help="SQLite file caching entity spans between runs")
+    args = parser.parse_args()
 
-    # Save the updated DataFrame
-    output_file = "masked_transcripts.csv"
-    data.to_csv(output_file, index=False)
-    print(f"Saved masked data to {output_file}")
+    stream_mask_file(args.input, args.output, column=args.column, batch_rows=args.batch_rows,
+                     num_workers=args.workers, span_cache_path=args.span_cache)
@@ -1,30 +1,481 @@
 import re
-from collections import Counter, defaultdict
 from difflib import SequenceMatcher
-import re
 import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 import tiktoken
 import logging
 import concurrent.futures
+import functools
 import threading
+import time
+import hashlib
+import heapq
+import itertools
+import os
+import pickle
+import zlib
+from collections import defaultdict, deque
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+class PairMerger:
+    """
+    Incremental engine behind textCleaning.merge_most_frequent.
+
+    All documents are held as one linked list of tokens whose node ids
+    increase in document order (a merged token keeps the id of its left
+    half). For every adjacent pair it keeps the exact count plus a heap of
+    the nodes where it starts, and a priority queue orders pairs by
+    (highest count, earliest first occurrence). A merge only visits the
+    occurrences of the merged pair and updates the pairs around them,
+    instead of recounting and rebuilding every document.
+
+    Ties are broken by earliest occurrence, which is what
+    Counter.most_common(1) did on a full recount, so the sequence of merges
+    (and therefore the extracted phrases) is unchanged.
+    """
+    def __init__(self, documents):
+        self.tokens = []  # token per node, None once merged into its left neighbour
+        self.prev = []    # previous node in the same document, -1 at the start
+        self.next = []    # next node in the same document, -1 at the end
+        self.pair_counts = {}
+        self.pair_nodes = defaultdict(list)  # pair -> heap of nodes where it may start
+        self.queue = []   # heap of (-count, first node, pair), stale entries skipped lazily
+        self.starts = []  # first node of every document (-1 for an empty one)
+
+        for tokens in documents:
+            self.add_document(tokens)
+        for pair in self.pair_counts:
+            self._push(pair)
+
+    def add_document(self, tokens):
+        """Appends one tokenized document (its pairs are queued by the next _push)."""
+        base = len(self.tokens)
+        size = len(tokens)
+        self.tokens.extend(tokens)
+        self.prev.extend(range(base - 1, base + size - 1))
+        self.next.extend(range(base + 1, base + size + 1))
+        self.starts.append(base if size else -1)
+        if size:
+            self.prev[base] = -1
+            self.next[-1] = -1
+        for node in range(base, base + size - 1):
+            self._add((tokens[node - base], tokens[node - base + 1]), node)
+
+    def most_frequent_pair(self):
+        """Returns (pair, count) for the most frequent pair, or None if there are no pairs."""
+        while self.queue:
+            neg_count, first, pair = self.queue[0]
+            if self.pair_counts.get(pair, 0) == -neg_count and self._first(pair) == first:
+                return pair, -neg_count
+            heapq.heappop(self.queue)
+        return None
+
+    def merge(self, pair):
+        """Merges every non-overlapping occurrence of `pair`, left to right within each document."""
+        left, right = pair
+        merged = f"{left}_{right}"
+        touched = set()
+
+        for node in sorted(self.pair_nodes.pop(pair, [])):
+            if not self._starts(node, pair):
+                continue  # consumed by the previous occurrence, e.g. "a a a"
+            nxt = self.next[node]
+            before = self.prev[node]
+            after = self.next[nxt]
+
+            if before != -1:
+                touched.add(self._remove((self.tokens[before], left)))
+            self._remove(pair)
+            if after != -1:
+                touched.add(self._remove((right, self.tokens[after])))
+
+            self.tokens[node] = merged
+            self.tokens[nxt] = None
+            self.next[node] = after
+            if after != -1:
+                self.prev[after] = node
+
+            if before != -1:
+                touched.add(self._add((self.tokens[before], merged), before))
+            if after != -1:
+                touched.add(self._add((merged, self.tokens[after]), node))
+
+        touched.discard(pair)
+        for changed in touched:
+            self._push(changed)
+
+    def documents(self):
+        """Yields the current token list of every document."""
+        for start in self.starts:
+            doc = []
+            node = start
+            while node != -1:
+                doc.append(self.tokens[node])
+                node = self.next[node]
+            yield doc
+
+    def _starts(self, node, pair):
+        nxt = self.next[node]
+        return self.tokens[node] == pair[0] and nxt != -1 and self.tokens[nxt] == pair[1]
+
+    def _first(self, pair):
+        nodes = self.pair_nodes.get(pair)
+        while nodes and not self._starts(nodes[0], pair):
+            heapq.heappop(nodes)
+        return nodes[0] if nodes else None
+
+    def _add(self, pair, node):
+        self.pair_counts[pair] = self.pair_counts.get(pair, 0) + 1
+        heapq.heappush(self.pair_nodes[pair], node)
+        return pair
+
+    def _remove(self, pair):
+        count = self.pair_counts[pair] - 1
+        if count:
+            self.pair_counts[pair] = count
+        else:
+            del self.pair_counts[pair]
+            self.pair_nodes.pop(pair, None)
+        return pair
+
+    def _push(self, pair):
+        count = self.pair_counts.get(pair, 0)
+        if count:
+            heapq.heappush(self.queue, (-count, self._first(pair), pair))
+
+class PhraseIndex:
+    """
+    Compiled reference phrases for disclaimer removal.
+
+    Phrases are grouped by their first alphabetic word, as before, and
+    each one is stored with its word tuple and character length. match()
+    scans a document in one pass. It finds the first word at each position
+    from a precomputed table instead of re-joining the rest of the
+    document. Each candidate phrase is then checked in increasing order of
+    cost:
+
+    1. An exact word-for-word match (similarity 1.0).
+    2. The length bound 2 * min(len) / total that SequenceMatcher.ratio()
+       can never exceed.
+    3. quick_ratio().
+    4. The exact ratio(), computed with a matcher cached per phrase.
+
+    Every filter is an upper bound on SequenceMatcher(None, window,
+    phrase).ratio(), so the windows removed are exactly those with
+    similarity >= `similarity_threshold`.
+    """
+    FIRST_WORD = re.compile(r'\b[a-zA-Z]+\b')
+
+    def __init__(self, reference_phrases, similarity_threshold):
+        self.reference_phrases = list(reference_phrases)
+        self.similarity_threshold = similarity_threshold
+        # first word -> [(phrase text, words, word count, char length, single-spaced)]
+        self.phrases = {}
+        for phrase in self.reference_phrases:
+            text = phrase.replace("_", " ")
+            match = self.FIRST_WORD.search(text)
+            words = tuple(text.split())
+            entry = (text, words, len(words), len(text), text == " ".join(words))
+            self.phrases.setdefault(match.group() if match else "", []).append(entry)
+        # SequenceMatchers are stateful, so every thread gets its own cache
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Matchers are rebuilt lazily wherever the index is unpickled
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def first_words(self, tokens):
+        """first_words(tokens)[i] is the first alphabetic word found in tokens[i:], or ""."""
+        cache = {}
+        result = [""] * len(tokens)
+        following = ""
+        for i in range(len(tokens) - 1, -1, -1):
+            token = tokens[i]
+            word = cache.get(token)
+            if word is None:
+                match = self.FIRST_WORD.search(token)
+                word = cache[token] = match.group() if match else ""
+            if word:
+                following = word
+            result[i] = following
+        return result
+
+    def match(self, tokens):
+        """
+        Finds the disclaimer windows in a tokenized document.
+
+        Returns (mask, removed_length): mask[i] is 1 for tokens to remove,
+        removed_length the summed character length of the matched windows.
+        """
+        threshold = self.similarity_threshold
+        matchers = getattr(self._local, "matchers", None)
+        if matchers is None:
+            matchers = self._local.matchers = {}
+        n = len(tokens)
+        mask = bytearray(n)
+        removed_length = 0
+
+        # offsets[j] - offsets[i] - 1 is the length of " ".join(tokens[i:j])
+        offsets = [0] * (n + 1)
+        for i, token in enumerate(tokens):
+            offsets[i + 1] = offsets[i] + len(token) + 1
+
+        for i, first_word in enumerate(self.first_words(tokens)):
+            candidates = self.phrases.get(first_word)
+            if candidates is None:
+                continue
+
+            for text, words, length, text_len, single_spaced in candidates:
+                if i + length > n:
+                    continue
+
+                window_len = offsets[i + length] - offsets[i] - 1 if length else 0
+                if single_spaced and threshold <= 1.0 and tuple(tokens[i:i + length]) == words:
+                    pass  # identical to the phrase: similarity 1.0
+                else:
+                    total = window_len + text_len
+                    if total and 2.0 * min(window_len, text_len) / total < threshold:
+                        continue
+                    matcher = matchers.get(text)
+                    if matcher is None:
+                        matcher = matchers[text] = SequenceMatcher(None, "", text)
+                    matcher.set_seq1(" ".join(tokens[i:i + length]))
+                    if matcher.quick_ratio() < threshold or matcher.ratio() < threshold:
+                        continue
+
+                mask[i:i + length] = b"\x01" * length
+                removed_length += window_len
+                break
+
+        return mask, removed_length
+
+def learn_merges(merger, num_merges):
+    """
+    Merges the most frequent pair of `merger` (a PairMerger) up to
+    `num_merges` times, stopping early once no pair occurs twice. Returns
+    the merged pairs in order.
+    """
+    merges = []
+    for numMerge in range(num_merges):
+        best = merger.most_frequent_pair()
+        if best is None:
+            break
+
+        most_frequent_pair, freq = best
+        if freq < 2:
+            break
+
+        merger.merge(most_frequent_pair)
+        merges.append(most_frequent_pair)
+
+        if  numMerge % 50 == 0:
+            logging.info(f"Total merges performed: {numMerge}")
+    return merges
+
+def merged_phrases(tokens, top_n):
+    """The distinct merged tokens made of more than `top_n` words, sorted."""
+    phrases = {token for token in tokens if token is not None and "_" in token}
+    return sorted(phrase for phrase in phrases if len(phrase.split("_")) > top_n)
+
+class DisclaimerPhraseModel:
+    """
+    Disclaimer phrases fitted once and reused across runs and workers.
+
+    fit() mines the phrases as textCleaning.merge_most_frequent does and
+    compiles them into a PhraseIndex. save() writes the phrases, the
+    learned merges and the merged tokens of the fitted documents to one
+    versioned pickle of plain data, so it loads under any import path of
+    this module; load() reads it back and recompiles the index, which is
+    cheap, without re-mining. The index can be passed anywhere reference
+    phrases are accepted (see textCleaning.iter_clean_documents).
+
+    update() refits on new documents without re-mining the old ones: the
+    merges learned so far are replayed on the new documents, as a BPE
+    tokenizer would, and then further merges are learned from the new
+    documents together with the merged tokens of the `sample_size` most
+    recently fitted ones. Only that window is kept, so the saved model and
+    the cost of a refit stay bounded however often it is updated. By default the
+    number of new merges is `num_merges` scaled by the ratio of new to
+    already fitted documents (at most `num_merges`), so an update with no
+    new documents changes nothing.
+    Phrases are re-extracted afterwards from the same documents, so an update
+    can add phrases and also replace phrases with longer ones. The merges already learned are
+    kept even if the new documents would have ranked them differently, so
+    the result can differ from fitting on all documents from scratch.
+    """
+    FORMAT = "disclaimer-phrase-model"
+    VERSION = 1
+
+    def __init__(self, num_merges=1000, top_n=5, similarity_threshold=0.95, sample_size=1000):
+        self.num_merges = num_merges
+        self.top_n = top_n
+        self.similarity_threshold = similarity_threshold
+        self.sample_size = sample_size
+        self.merges = []  # merged pairs, in the order they were learned
+        self.n_documents = 0
+        self._sample = zlib.compress(b"")  # merged tokens of the latest fitted documents, see _pack
+        self._set_phrases([])
+
+    def _set_phrases(self, phrases):
+        self.phrases = list(phrases)
+        self.index = PhraseIndex(self.phrases, self.similarity_threshold)
+
+    @property
+    def fingerprint(self):
+        """Hash of everything that affects cleaning: the phrases and the similarity threshold."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((self.similarity_threshold, self.phrases)).encode("utf-8"))
+        return digest.hexdigest()
+
+    def fit(self, documents):
+        """Mines the phrases from `documents`, discarding anything fitted before."""
+        self.merges = []
+        self.n_documents = 0
+        self._sample = zlib.compress(b"")
+        return self.update(documents)
+
+    def update(self, documents, num_merges=None):
+        """Refits on additional documents (see the class docstring); returns self."""
+        tokenized = [textCleaning.tokenize(text) for text in documents]
+        if num_merges is None:
+            num_merges = -(-self.num_merges * len(tokenized) // max(self.n_documents, len(tokenized), 1))
+        merger = PairMerger(self._unpack(self._sample) + tokenized)
+        # Only the new documents still contain these pairs
+        for pair in self.merges:
+            merger.merge(pair)
+        self.merges.extend(learn_merges(merger, num_merges))
+
+        self.n_documents += len(tokenized)
+        self._sample = self._pack(deque(merger.documents(), maxlen=self.sample_size))
+        self._set_phrases(merged_phrases(merger.tokens, self.top_n))
+        return self
+
+    @staticmethod
+    def _pack(documents):
+        # Tokens never contain whitespace, so the documents fit in one compressed string
+        return zlib.compress("\n".join(" ".join(tokens) for tokens in documents).encode("utf-8"))
+
+    @staticmethod
+    def _unpack(packed):
+        text = zlib.decompress(packed).decode("utf-8")
+        return [line.split() for line in text.split("\n")] if text else []
+
+    def save(self, path):
+        """Writes the model to `path`, replacing it atomically."""
+        state = {
+            "format": self.FORMAT,
+            "version": self.VERSION,
+            "config": {"num_merges": self.num_merges, "top_n": self.top_n,
+                       "similarity_threshold": self.similarity_threshold, "sample_size": self.sample_size},
+            "phrases": self.phrases,
+            "merges": self.merges,
+            "n_documents": self.n_documents,
+            "sample": self._sample,
+        }
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a model written by save(). Raises ValueError for other files or versions."""
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if not isinstance(state, dict) or state.get("format") != cls.FORMAT:
+            raise ValueError(f"{path} is not a disclaimer phrase model.")
+        if state["version"] != cls.VERSION:
+            raise ValueError(f"{path} has model version {state['version']}; expected {cls.VERSION}. Refit it.")
+        model = cls(**state["config"])
+        model._set_phrases(state["phrases"])
+        model.merges = state["merges"]
+        model.n_documents = state["n_documents"]
+        model._sample = state["sample"]
+        return model
+
+def clean_document(document, phrase_index):
+    """
+    Removes the disclaimer windows found by `phrase_index` from one document.
+
+    Returns (cleaned_document, removed_length, token_ratio), where
+    token_ratio is cleaned tokens / original tokens (0 for an empty document).
+    """
+    tokens = textCleaning.tokenize(document)
+    to_remove, total_removed_length = phrase_index.match(tokens)
+
+    # Remove identified sections
+    cleaned_tokens = [token for token, removed in zip(tokens, to_remove) if not removed]
+    cleaned_document = " ".join(cleaned_tokens)
+
+    # Compute token ratio: cleaned tokens / original tokens
+    original_token_count = len(tokens)
+    cleaned_token_count = len(cleaned_tokens)
+    token_ratio = cleaned_token_count / original_token_count if original_token_count > 0 else 0
+
+    return cleaned_document, total_removed_length, token_ratio
+
+# Phrase index of the current worker, installed once per process by _init_worker
+_WORKER_INDEX = None
+
+def _init_worker(phrase_index):
+    global _WORKER_INDEX
+    _WORKER_INDEX = phrase_index
+
+def _clean_chunk(documents, phrase_index=None):
+    """Cleans a chunk of documents; returns (results, seconds spent, input characters)."""
+    phrase_index = phrase_index or _WORKER_INDEX
+    start = time.perf_counter()
+    results = [clean_document(document, phrase_index) for document in documents]
+    return results, time.perf_counter() - start, sum(len(document) for document in documents)
+
+def iter_text_column(path, column, batch_size=1000):
+    """
+    Yields the values of one text column of a CSV file or a Parquet file /
+    dataset directory, reading `batch_size` rows at a time so the corpus is
+    never loaded whole. Missing values are yielded as "".
+    """
+    if path.endswith(".csv"):
+        import pandas as pd
+
+        for batch in pd.read_csv(path, usecols=[column], chunksize=batch_size):
+            yield from batch[column].fillna("").astype(str)
+        return
+
+    import pyarrow.dataset as ds
+
+    for batch in ds.dataset(path, format="parquet").to_batches(columns=[column], batch_size=batch_size):
+        for value in batch.column(0).to_pylist():
+            yield value if value is not None else ""
+
 class textCleaning:
-    def __init__(self, num_merges=1000, top_n=5, similarity_threshold=0.95):
+    def __init__(self, num_merges=1000, top_n=5, similarity_threshold=0.95, metrics=None):
+        """
+        `metrics` is an optional PipelineMetrics (pipelineMetrics.py) that
+        receives phrase mining time and merges, and per-chunk cleaning time
+        with document, character, token and removal counts.
+        """
         self.num_merges = num_merges
         self.top_n = top_n
         self.similarity_threshold = similarity_threshold
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
-        #  Load OpenAI's tokenizer (using GPT-4 encoding)
+        self.metrics = metrics
+        self._tokenizer = None  # loaded by clean() on first use
         nltk.download("punkt")
         nltk.download("stopwords")
-        self.lock = threading.Lock()  # Ensure thread-safe logging
         self.processed_count = 0  # Track processed documents
 
+    @property
+    def tokenizer(self):
+        """OpenAI's tokenizer (GPT-4 encoding), only needed by clean()."""
+        if self._tokenizer is None:
+            self._tokenizer = tiktoken.get_encoding("cl100k_base")
+        return self._tokenizer
 
     @staticmethod
     def tokenize(text):
@@ -44,49 +495,37 @@ class textCleaning:
         Iteratively merges the most frequent adjacent word pairs in documents.
         Extracts all merged phrases that have at least `top_n` words.
 
+        Pair counts are maintained incrementally by PairMerger, so each merge
+        costs time proportional to the occurrences it touches rather than to
+        the whole corpus.
+
         Returns:
         - List[str]: Merged phrases with at least `top_n` words.
-        """
-        documents = [self.tokenize(text) for text in documents]
-
-        for numMerge in range(self.num_merges):
-            pair_counts = Counter()
-            for tokens in documents:
-                pair_counts.update(self.get_word_pairs(tokens))
-
-            if not pair_counts:
-                break
 
-            most_frequent_pair, freq = pair_counts.most_common(1)[0]
-            if freq < 2:
-                break
+        Use fit_phrase_model to keep the phrases (compiled) for later runs.
+        """
+        start = time.perf_counter()
+        merger = PairMerger(self.tokenize(text) for text in documents)
+        merges = learn_merges(merger, self.num_merges)
 
-            merged_phrase = f"{most_frequent_pair[0]}_{most_frequent_pair[1]}"
-
-            updated_documents = []
-            for tokens in documents:
-                merged_tokens = []
-                i = 0
-                while i < len(tokens):
-                    if i < len(tokens) - 1 and (tokens[i], tokens[i + 1]) == most_frequent_pair:
-                        merged_tokens.append(merged_phrase)
-                        i += 2
-                    else:
-                        merged_tokens.append(tokens[i])
-                        i += 1
-                updated_documents.append(merged_tokens)
-
-            documents = updated_documents
-
-            if  numMerge % 50 == 0:
-                logging.info(f"Total merges performed: {numMerge}")
-    
         # Extract only the top `top_n` longest merged phrases
-        merged_phrases = set()
-        for tokens in documents:
-            merged_phrases.update([token for token in tokens if "_" in token])
-
-        return [phrase for phrase in merged_phrases if len(phrase.split("_")) > self.top_n]
+        phrases = merged_phrases(merger.tokens, self.top_n)
+
+        if self.metrics is not None:
+            self.metrics.observe("mine_phrases_seconds", time.perf_counter() - start)
+            self.metrics.inc("phrase_merges_total", len(merges))
+            self.metrics.inc("phrases_mined_total", len(phrases))
+        return phrases
+
+    def fit_phrase_model(self, documents):
+        """Mines the phrases of `documents` into a DisclaimerPhraseModel with this instance's settings."""
+        start = time.perf_counter()
+        model = DisclaimerPhraseModel(self.num_merges, self.top_n, self.similarity_threshold).fit(documents)
+        if self.metrics is not None:
+            self.metrics.observe("mine_phrases_seconds", time.perf_counter() - start)
+            self.metrics.inc("phrase_merges_total", len(model.merges))
+            self.metrics.inc("phrases_mined_total", len(model.phrases))
+        return model
 
     @staticmethod
     def similarity_score(a, b):
@@ -100,95 +539,165 @@ class textCleaning:
         return words[0] if words else ""
 
 
-    def process_documents_with_logging(self, documents, reference_phrases, num_threads=4):
-        """Parallelized method for processing documents, logging progress rate and token ratio."""
-        
-        total_docs = len(documents)  # Total number of documents
+    def iter_clean_documents(self, documents, reference_phrases, num_threads=4, backend="threads",
+                             chunksize=64, max_pending=None, total=None):
+        """
+        Streaming form of process_documents_with_logging.
+
+        Consumes `documents` (any iterable, e.g. iter_text_column) lazily and
+        yields (cleaned_document, removed_length, token_ratio) per document,
+        in input order. `reference_phrases` may be a list of phrases, an
+        already compiled PhraseIndex or a DisclaimerPhraseModel (whose own
+        similarity threshold then applies). At most `max_pending` chunks (default
+        2 * num_threads) are read ahead of the consumer, so memory stays
+        bounded however large the corpus, and a slow consumer holds back the
+        workers instead of letting results pile up.
+
+        backend, num_threads and chunksize are as in
+        process_documents_with_logging. Progress is logged once per chunk;
+        pass `total` to include a percentage. Chunk timings are measured in
+        the workers and recorded here, in the calling thread, so the
+        metrics see every backend.
+        """
+        if isinstance(reference_phrases, PhraseIndex):
+            phrase_index = reference_phrases
+        elif isinstance(reference_phrases, DisclaimerPhraseModel):
+            phrase_index = reference_phrases.index
+        else:
+            # Index the phrases by first word once; see PhraseIndex for the matching rules
+            phrase_index = PhraseIndex(reference_phrases, self.similarity_threshold)
+        max_pending = max_pending or 2 * num_threads
+
+        documents = iter(documents)
+        chunks = iter(lambda: list(itertools.islice(documents, chunksize)), [])
+
+        if backend == "inline":
+            executor = None
+        elif backend == "threads":
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_threads)
+        elif backend == "processes":
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_threads, initializer=_init_worker, initargs=(phrase_index,)
+            )
+        else:
+            raise ValueError(f"Unknown backend {backend!r}; expected 'threads', 'processes' or 'inline'")
+
+        def chunk_results():
+            if executor is None:
+                for chunk in chunks:
+                    yield _clean_chunk(chunk, phrase_index)
+                return
+
+            task = _clean_chunk if backend == "processes" else functools.partial(_clean_chunk, phrase_index=phrase_index)
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(task, chunk))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+        done = 0
+        try:
+            for results, seconds, input_chars in chunk_results():
+                yield from results
+
+                if self.metrics is not None:
+                    self._record_chunk(results, seconds, input_chars, backend)
+                done += len(results)
+                self.processed_count += len(results)
+                progress = f"{done}/{total} ({done / total * 100:.2f}%)" if total else f"{done}"
+                logging.info(f"Progress: {progress} - "
+                             f"Removed text length: {sum(result[1] for result in results)} - "
+                             f"Mean Token Ratio: {sum(result[2] for result in results) / len(results):.4f}")
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def _record_chunk(self, results, seconds, input_chars, backend):
+        metrics = self.metrics
+        metrics.observe("clean_chunk_seconds", seconds, backend=backend)
+        metrics.inc("clean_documents_total", len(results))
+        metrics.inc("clean_input_chars_total", input_chars)
+        metrics.inc("clean_removed_chars_total", sum(result[1] for result in results))
+        metrics.inc("clean_output_tokens_total", sum(result[0].count(" ") + 1 for result in results if result[0]))
+
+    def process_documents_with_logging(self, documents, reference_phrases, num_threads=4,
+                                       backend="threads", chunksize=64, return_stats=False):
+        """
+        Parallelized method for processing documents, logging progress rate and token ratio.
+
+        backend selects how documents are processed:
+        - "threads": a ThreadPoolExecutor (little speed-up, the work is pure Python)
+        - "processes": a ProcessPoolExecutor; the compiled PhraseIndex is sent to
+          each worker once. Call this from under `if __name__ == '__main__':`.
+        - "inline": in the calling thread
+        num_threads is the number of workers for either pool. Documents are sent
+        in chunks of `chunksize`, results come back in input order, and progress
+        is logged once per chunk from the calling thread, so workers never share
+        a lock.
+
+        Returns the cleaned documents, or (cleaned_documents, removal_lengths,
+        token_ratios) if return_stats=True. See iter_clean_documents for the
+        streaming form.
+        """
         cleaned_documents = []
         removal_lengths = []
         token_ratios = []
 
-        # Build dictionary where key = first word, value = list of full phrases
-        phrase_dict = defaultdict(list)
-        for phrase in reference_phrases:
-            first_word = self.get_first_word(phrase.replace("_", " "))
-            phrase_dict[first_word].append(phrase.replace("_", " "))
-
-        def process_single_document(document):
-            tokens = self.tokenize(document)
-            to_remove = set()
-            removed_texts = []
-
-            for i in range(len(tokens)):
-                window_text = " ".join(tokens[i:])
-                window_first_word = self.get_first_word(window_text)
-
-                # Skip if first word is not in the dictionary
-                if window_first_word not in phrase_dict:
-                    continue  
-
-                # Iterate over all matching phrases for this first word
-                for phrase in phrase_dict[window_first_word]:
-                    phrase_length = len(phrase.split())
-
-                    if i + phrase_length > len(tokens):
-                        continue  
-
-                    # Extract window of the same length as the phrase
-                    window_text = " ".join(tokens[i:i + phrase_length])
-
-                    # Compute similarity
-                    if self.similarity_score(window_text, phrase) >= self.similarity_threshold:
-                        to_remove.update(range(i, i + phrase_length))
-                        removed_texts.append(window_text)  # Store removed text
-                        break  
-
-            # Compute removed text length
-            total_removed_length = sum(len(text) for text in removed_texts)
-
-            # Remove identified sections
-            cleaned_tokens = [tokens[i] for i in range(len(tokens)) if i not in to_remove]
-            cleaned_document = " ".join(cleaned_tokens)
-
-            # Compute token ratio: cleaned tokens / original tokens
-            original_token_count = len(tokens)
-            cleaned_token_count = len(cleaned_tokens)
-            token_ratio = cleaned_token_count / original_token_count if original_token_count > 0 else 0
-
-            # Thread-safe logging & progress update
-            with self.lock:
-                self.processed_count += 1
-                progress = (self.processed_count / total_docs) * 100
-                logging.info(f"Progress: {self.processed_count}/{total_docs} ({progress:.2f}%) - Removed text length: {total_removed_length} - Token Ratio: {token_ratio:.4f}")
-
-            return cleaned_document, total_removed_length, token_ratio
-
-        # Use ThreadPoolExecutor for parallel processing
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-            results = list(executor.map(process_single_document, documents))
-
-        # Unpack results
-        for cleaned_doc, removed_len, token_ratio in results:
+        for cleaned_doc, removed_len, token_ratio in self.iter_clean_documents(
+            documents, reference_phrases, num_threads=num_threads, backend=backend,
+            chunksize=chunksize, total=len(documents)
+        ):
             cleaned_documents.append(cleaned_doc)
             removal_lengths.append(removed_len)
             token_ratios.append(token_ratio)
 
+        if return_stats:
+            return cleaned_documents, removal_lengths, token_ratios
         return cleaned_documents
-        
-    def process_documents(self, documents):
+
+    def iter_process_documents(self, documents, mining_sample=99, **options):
+        """
+        Streaming form of process_documents: mines disclaimer phrases from the
+        `mining_sample` documents after the first one, like process_documents'
+        default documents[1:100] (only those are held in memory), then yields
+        (cleaned_document, removed_length, token_ratio) for every document,
+        including the sample. `options` are passed to iter_clean_documents.
+        """
+        documents = iter(documents)
+        sample = list(itertools.islice(documents, 1 + mining_sample))
+        top_disclaimer_phrases = self.merge_most_frequent(sample[1:])
+        logging.info(f"Extracted {len(top_disclaimer_phrases)} phrases with at least {self.top_n} words.")
+        return self.iter_clean_documents(itertools.chain(sample, documents), top_disclaimer_phrases, **options)
+
+    def process_documents(self, documents, mining_documents=None, backend="threads", num_workers=4,
+                          phrase_model=None):
         """
         Full pipeline:
         1. Extracts frequent merged phrases.
         2. Removes similar sections.
 
+        Phrases are mined from `mining_documents`, by default documents[1:100];
+        pass the documents themselves to mine the full corpus. Pass a fitted
+        DisclaimerPhraseModel as `phrase_model` to skip mining. backend and
+        num_workers are passed to process_documents_with_logging.
+
         Returns:
         - List[str]: Cleaned documents.
         """
-        print("\n🔍 Extracting most frequent merged phrases...")
-        top_disclaimer_phrases = self.merge_most_frequent(documents[1:100])
-        print(f"✅ Extracted {len(top_disclaimer_phrases)} phrases with at least {self.top_n} words.")
+        if phrase_model is not None:
+            top_disclaimer_phrases = phrase_model
+            print(f"✅ Using {len(phrase_model.phrases)} fitted phrases.")
+        else:
+            if mining_documents is None:
+                mining_documents = documents[1:100]
+            print("\n🔍 Extracting most frequent merged phrases...")
+            top_disclaimer_phrases = self.merge_most_frequent(mining_documents)
+            print(f"✅ Extracted {len(top_disclaimer_phrases)} phrases with at least {self.top_n} words.")
         print("\n🧹 Removing detected disclaimer sections...")
-        cleaned_documents = self.process_documents_with_logging(documents, top_disclaimer_phrases)
+        cleaned_documents = self.process_documents_with_logging(documents, top_disclaimer_phrases,
+                                                                num_threads=num_workers, backend=backend)
         print("✅ Disclaimer sections removed.")
 
         return cleaned_documents
@@ -0,0 +1,136 @@
+import sqlite3
+import time
+
+class CrawlState:
+    """
+    Persistent crawl-state index for scrape_and_append_to_csv.
+
+    Records which listing pages have been finished and which article URLs
+    have already been stored, in a small SQLite file next to the output.
+    A restarted or overlapping run uses it to skip finished pages and to
+    avoid re-downloading (and re-appending) articles it already has, even
+    when articles shift between listing pages. Articles whose fetch failed
+    are kept apart, so later runs retry them, until they have failed
+    `max_attempts` times (e.g. a removed article that keeps returning 404).
+    They are then given up on and treated like stored articles.
+    """
+    # SQLite's default limit on bound parameters is 999
+    QUERY_CHUNK = 500
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                page_number INTEGER PRIMARY KEY,
+                article_count INTEGER NOT NULL,
+                finished_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS articles (
+                url TEXT PRIMARY KEY,
+                page_number INTEGER,
+                stored_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS failed_articles (
+                url TEXT PRIMARY KEY,
+                page_number INTEGER,
+                attempts INTEGER NOT NULL,
+                failed_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def is_empty(self):
+        """True if no article has been recorded yet."""
+        return self.conn.execute("SELECT 1 FROM articles LIMIT 1").fetchone() is None
+
+    def finished_pages(self, page_numbers):
+        """Returns the subset of `page_numbers` recorded as finished."""
+        return self._select_existing("pages", "page_number", list(page_numbers))
+
+    def known_articles(self, urls):
+        """Returns the subset of `urls` that have already been stored or been given up on."""
+        urls = list(urls)
+        return (self._select_existing("articles", "url", urls)
+                | self._select_existing("failed_articles", "url", urls, "attempts >= ?", (self.max_attempts,)))
+
+    def failed_articles(self, given_up=None):
+        """
+        Returns the URLs whose last fetch failed and that have not been
+        stored since: all of them, or with given_up=True / False only those
+        given up on / still to be retried.
+        """
+        query = "SELECT url FROM failed_articles"
+        if given_up is not None:
+            query += " WHERE attempts >= ?" if given_up else " WHERE attempts < ?"
+            return {row[0] for row in self.conn.execute(query, (self.max_attempts,))}
+        return {row[0] for row in self.conn.execute(query)}
+
+    def record_page(self, page_number, urls, finished=True, failed_urls=()):
+        """
+        Records the articles stored from one listing page, the ones whose
+        fetch failed, and the page itself as finished, in a single
+        transaction. A page with failed articles that are still to be
+        retried is not recorded as finished, so the next run lists it again.
+        Returns the failed URLs given up on by this call.
+        """
+        now = time.time()
+        urls = list(urls)
+        failed_urls = list(failed_urls)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO articles (url, page_number, stored_at) VALUES (?, ?, ?)",
+                [(url, page_number, now) for url in urls]
+            )
+            self.conn.executemany("DELETE FROM failed_articles WHERE url = ?", [(url,) for url in urls])
+            self.conn.executemany(
+                "INSERT INTO failed_articles (url, page_number, attempts, failed_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (url) DO UPDATE SET page_number = excluded.page_number, "
+                "attempts = attempts + 1, failed_at = excluded.failed_at",
+                [(url, page_number, now) for url in failed_urls]
+            )
+            given_up = self._select_existing("failed_articles", "url", failed_urls,
+                                             "attempts >= ?", (self.max_attempts,))
+            if finished and len(given_up) == len(set(failed_urls)):
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pages (page_number, article_count, finished_at) VALUES (?, ?, ?)",
+                    (page_number, len(urls), now)
+                )
+        return given_up
+
+    def seed_articles(self, urls):
+        """
+        Marks `urls` as stored without a page, e.g. to import the URLs of an
+        output file written before the crawl state existed.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO articles (url, page_number, stored_at) VALUES (?, NULL, ?)",
+                ((url, now) for url in urls)
+            )
+
+    def _select_existing(self, table, column, values, condition=None, parameters=()):
+        found = set()
+        condition = f" AND {condition}" if condition else ""
+        for start in range(0, len(values), self.QUERY_CHUNK):
+            chunk = values[start:start + self.QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT {column} FROM {table} WHERE {column} IN ({placeholders}){condition}",
+                list(chunk) + list(parameters)
+            )
+            found.update(row[0] for row in rows)
+        return found
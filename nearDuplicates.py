@@ -0,0 +1,208 @@
+import os
+import pickle
+import re
+import zlib
+
+import numpy as np
+
+# Mersenne prime 2^31 - 1: the field of the universal hash functions
+MERSENNE_PRIME = (1 << 31) - 1
+
+WORD = re.compile(r"\w+")
+
+class NearDuplicateIndex:
+    """
+    MinHash / LSH index of documents, to find reposted and near-identical
+    articles or transcripts before they go through cleaning and NER.
+
+    Each document is reduced to the set of its `shingle_size`-word shingles
+    (lowercased words, hashed with crc32) and summarised by a MinHash
+    signature of `num_perm` universal hash functions
+    h(x) = (a * x + b) mod (2^31 - 1). The fraction of equal signature
+    entries estimates the Jaccard similarity of two shingle sets. The
+    signatures are split into `bands` bands; documents sharing a band are
+    candidates, and a candidate whose estimated similarity is at least
+    `threshold` is a near duplicate. With the defaults (32 bands of 4),
+    pairs at 0.8 similarity are found with probability above 0.999999.
+
+    add() is incremental and idempotent per document id, so the index can
+    be kept up to date as the scraper appends rows and saved between runs
+    with save() / load().
+    """
+    FORMAT = "near-duplicate-index"
+    VERSION = 1
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=32, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands}).")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.signatures = {}    # document id -> uint32 signature
+        self.duplicate_of = {}  # document id -> id of the first document it duplicates
+        self.buckets = [{} for _ in range(bands)]  # band -> band bytes -> [document ids]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.signatures
+
+    def shingles(self, text):
+        """crc32 hashes of the distinct word shingles of `text` (the whole text if it is shorter)."""
+        words = WORD.findall(text.lower())
+        k = min(self.shingle_size, len(words))
+        if not k:
+            return np.empty(0, dtype=np.uint64)
+        hashes = {zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)}
+        return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+    def signature(self, text):
+        """MinHash signature of `text`, or None for a text without words."""
+        shingles = self.shingles(text)
+        if not len(shingles):
+            return None
+        # Below 2^31 after the reduction, so a * x + b stays within 64 bits
+        values = (np.outer(self.a, shingles % MERSENNE_PRIME) + self.b[:, None]) % MERSENNE_PRIME
+        return values.min(axis=1).astype(np.uint32)
+
+    def _bands(self, signature):
+        rows = self.rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def _match(self, signature, bands, exclude=None):
+        """(similarity, id) of the most similar indexed document, if at least threshold."""
+        candidates = set()
+        for bucket, key in zip(self.buckets, bands):
+            candidates.update(bucket.get(key, ()))
+        candidates.discard(exclude)
+        best = None
+        for candidate in candidates:
+            similarity = float(np.mean(self.signatures[candidate] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, candidate)
+        return best
+
+    def query(self, text):
+        """(id, estimated similarity) of the indexed document most similar to `text`, or None."""
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        best = self._match(signature, self._bands(signature))
+        return (best[1], best[0]) if best is not None else None
+
+    def add(self, doc_id, text):
+        """
+        Indexes a document and returns the id of the earlier document it
+        near-duplicates (the first one of its group), or None. Adding an id
+        that is already indexed returns the earlier answer without hashing.
+        Texts without words are not indexed and never duplicates.
+        """
+        if doc_id in self.signatures:
+            return self.duplicate_of.get(doc_id)
+        signature = self.signature(text) if isinstance(text, str) else None
+        if signature is None:
+            return None
+
+        bands = self._bands(signature)
+        best = self._match(signature, bands)
+        self.signatures[doc_id] = signature
+        for bucket, key in zip(self.buckets, bands):
+            bucket.setdefault(key, []).append(doc_id)
+        if best is None:
+            return None
+        original = self.duplicate_of.get(best[1], best[1])
+        self.duplicate_of[doc_id] = original
+        return original
+
+    def add_many(self, items):
+        """add() for every (doc_id, text) pair; returns the duplicate_of values in order."""
+        return [self.add(doc_id, text) for doc_id, text in items]
+
+    def save(self, path):
+        """Writes the index to `path`, replacing it atomically."""
+        state = {
+            "format": self.FORMAT,
+            "version": self.VERSION,
+            "config": {"threshold": self.threshold, "num_perm": self.num_perm, "bands": self.bands,
+                       "shingle_size": self.shingle_size, "seed": self.seed},
+            "ids": list(self.signatures),
+            "signatures": np.stack(list(self.signatures.values())) if self.signatures else None,
+            "duplicate_of": self.duplicate_of,
+        }
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """Reads an index written by save(). Raises ValueError for other files or versions."""
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if not isinstance(state, dict) or state.get("format") != cls.FORMAT:
+            raise ValueError(f"{path} is not a near-duplicate index.")
+        if state["version"] != cls.VERSION:
+            raise ValueError(f"{path} has index version {state['version']}; expected {cls.VERSION}. Rebuild it.")
+        index = cls(**state["config"])
+        index.duplicate_of = state["duplicate_of"]
+        if state["signatures"] is not None:
+            for doc_id, signature in zip(state["ids"], state["signatures"]):
+                index.signatures[doc_id] = signature
+                for bucket, key in zip(index.buckets, index._bands(signature)):
+                    bucket.setdefault(key, []).append(doc_id)
+        return index
+
+    @classmethod
+    def open(cls, path, **options):
+        """load(path) if it exists, else a new index with `options`."""
+        return cls.load(path) if os.path.exists(path) else cls(**options)
+
+def load_frame(path):
+    """Reads a scraped-articles output (see articleSinks.read_articles) or a pickled DataFrame."""
+    if path.endswith((".pkl", ".pickle")):
+        import pandas as pd
+
+        return pd.read_pickle(path)
+    from articleSinks import read_articles
+
+    return read_articles(path)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Flag near-duplicate articles or transcripts with MinHash / LSH.")
+    parser.add_argument("input", help="scraped articles (.csv, .parquet or .arrow directory) or a pickled DataFrame")
+    parser.add_argument("--column", default="content", help="text column, e.g. transcript")
+    parser.add_argument("--id-column", default=None, help="document id column (default: url if present, else the row)")
+    parser.add_argument("--index", default="near_duplicates.pkl", help="index file, created or extended")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--output", default=None, help="CSV of (id, duplicate_of) for the duplicates found")
+    args = parser.parse_args()
+
+    frame = load_frame(args.input)
+    id_column = args.id_column or ("url" if "url" in frame.columns else None)
+    ids = frame[id_column].astype(str).tolist() if id_column else [str(i) for i in range(len(frame))]
+
+    index = NearDuplicateIndex.open(args.index, threshold=args.threshold)
+    known = len(index)
+    duplicate_of = index.add_many(zip(ids, frame[args.column].tolist()))
+    index.save(args.index)
+
+    pairs = [(doc_id, original) for doc_id, original in zip(ids, duplicate_of) if original is not None]
+    print(f"Indexed {len(index) - known} new document(s) ({len(index)} in {args.index}); "
+          f"{len(pairs)} of {len(ids)} are near duplicates.")
+    if args.output:
+        import pandas as pd
+
+        pd.DataFrame(pairs, columns=["id", "duplicate_of"]).to_csv(args.output, index=False)
+        print(f"Saved the duplicate pairs to {args.output}.")
+
+if __name__ == "__main__":
+    main()
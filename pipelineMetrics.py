@@ -0,0 +1,198 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the default latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class PipelineMetrics:
+    """
+    Counters and latency histograms for a pipeline run, cheap enough to
+    record on every document, request or solve.
+
+    Every thread records into its own shard (a plain dict reached through a
+    threading.local), so recording never takes a lock and workers never
+    contend; the only lock is taken once per thread, to register its
+    shard. snapshot() adds the shards up. Process pools cannot share the
+    shards: record in the parent from what the workers return, or send a
+    worker's snapshot() back and merge() it.
+
+    Metrics are identified by a name and optional labels, e.g.
+    inc("http_responses_total", status=200, url_class="article"). Counter
+    names should end in "_total"; histogram values are in seconds unless
+    the name says otherwise. Components of the pipeline take an optional
+    `metrics` argument and record into it only when one is given.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.histogram_buckets = {}  # histogram name -> bucket bounds
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards = []
+        self._register_lock = threading.Lock()
+        self._merged = ({}, {})  # counters and histograms from merge()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = ({}, {})
+            with self._register_lock:
+                self._shards.append(shard)
+        return shard
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((key, str(value)) for key, value in labels.items())))
+
+    def set_buckets(self, name, buckets):
+        """Uses `buckets` (upper bounds) instead of the default ones for histogram `name`."""
+        self.histogram_buckets[name] = tuple(buckets)
+
+    def inc(self, name, value=1, **labels):
+        """Adds `value` to a counter."""
+        counters = self._shard()[0]
+        key = self._key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Records one value (e.g. a latency in seconds) in a histogram."""
+        histograms = self._shard()[1]
+        key = self._key(name, labels)
+        state = histograms.get(key)
+        if state is None:
+            buckets = self.histogram_buckets.get(name, self.buckets)
+            # [count per bucket (the last one is +Inf)..., sum, count]
+            state = histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        buckets = self.histogram_buckets.get(name, self.buckets)
+        state[bisect.bisect_left(buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Context manager observing the time spent in its block in histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _totals(self):
+        counters, histograms = {}, {}
+        with self._register_lock:
+            shards = list(self._shards)
+        for shard_counters, shard_histograms in [self._merged] + shards:
+            # dict.copy() is atomic, so a shard being written by its thread is read consistently
+            for key, value in shard_counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, state in shard_histograms.copy().items():
+                total = histograms.get(key)
+                histograms[key] = list(state) if total is None else [a + b for a, b in zip(total, state)]
+        return counters, histograms
+
+    def snapshot(self):
+        """
+        All metrics as a JSON-serialisable dict:
+        {"started", "elapsed_seconds", "counters": [{"name", "labels", "value"}],
+         "histograms": [{"name", "labels", "buckets", "counts", "sum", "count"}]}
+        where counts[i] is the number of values <= buckets[i] (not cumulative),
+        with one extra count for values above the last bucket.
+        """
+        counters, histograms = self._totals()
+        return {
+            "started": self.started,
+            "elapsed_seconds": time.time() - self.started,
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "buckets": list(self.histogram_buckets.get(name, self.buckets)),
+                 "counts": state[:-2], "sum": state[-2], "count": state[-1]}
+                for (name, labels), state in sorted(histograms.items())
+            ],
+        }
+
+    def merge(self, snapshot):
+        """Adds the metrics of another snapshot() (e.g. from a worker process) to this one."""
+        counters, histograms = self._merged
+        with self._register_lock:
+            for item in snapshot["counters"]:
+                key = self._key(item["name"], item["labels"])
+                counters[key] = counters.get(key, 0) + item["value"]
+            for item in snapshot["histograms"]:
+                if tuple(item["buckets"]) != self.histogram_buckets.get(item["name"], self.buckets):
+                    raise ValueError(f"Histogram {item['name']!r} has different buckets in the merged snapshot.")
+                key = self._key(item["name"], item["labels"])
+                state = item["counts"] + [item["sum"], item["count"]]
+                total = histograms.get(key)
+                histograms[key] = state if total is None else [a + b for a, b in zip(total, state)]
+
+    def summary(self):
+        """One line per histogram: count, mean and total time, slowest first."""
+        lines = []
+        for item in sorted(self.snapshot()["histograms"], key=lambda item: -item["sum"]):
+            labels = ",".join(f"{key}={value}" for key, value in item["labels"].items())
+            mean = item["sum"] / item["count"] if item["count"] else 0.0
+            lines.append(f"{item['name']}{{{labels}}}: {item['count']} x {mean * 1000:.2f} ms = {item['sum']:.2f} s")
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        """Writes snapshot() to `path` as JSON."""
+        _write_atomic(path, json.dumps(self.snapshot(), indent=2))
+
+    def write_prometheus(self, path, prefix="morningstar_"):
+        """
+        Writes the metrics in the Prometheus text exposition format, e.g. for
+        node_exporter's textfile collector. The file is replaced atomically,
+        so it can be rewritten periodically during a run.
+        """
+        _write_atomic(path, self.prometheus_text(prefix))
+
+    def prometheus_text(self, prefix="morningstar_"):
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for item in snapshot["counters"]:
+            name = prefix + item["name"]
+            declare(name, "counter")
+            lines.append(f"{name}{_prometheus_labels(item['labels'])} {item['value']}")
+        for item in snapshot["histograms"]:
+            name = prefix + item["name"]
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(list(item["buckets"]) + ["+Inf"], item["counts"]):
+                cumulative += count
+                labels = dict(item["labels"], le=bound if bound == "+Inf" else repr(float(bound)))
+                lines.append(f"{name}_bucket{_prometheus_labels(labels)} {cumulative}")
+            lines.append(f"{name}_sum{_prometheus_labels(item['labels'])} {item['sum']}")
+            lines.append(f"{name}_count{_prometheus_labels(item['labels'])} {item['count']}")
+        return "\n".join(lines) + "\n"
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def _write_atomic(path, text):
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+def write_metrics(metrics, path):
+    """Writes `metrics` as Prometheus text if `path` ends in .prom, JSON otherwise."""
+    if path.endswith(".prom"):
+        metrics.write_prometheus(path)
+    else:
+        metrics.write_json(path)
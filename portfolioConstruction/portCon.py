@@ -1,63 +1,243 @@
+import concurrent.futures
+import hashlib
+import itertools
+import os
+import time
+from collections import OrderedDict, deque
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from mosek.fusion import Model, Expr, Domain, ObjectiveSense
 
 class Optimizer:
-    def __init__(self, risk_budget=0.01, gme_limit=2):
+    SOLVERS = ("mosek", "diagonal")
+    RISK_MODELS = ("diagonal", "factor")
+    MAX_CACHED_MODELS = 8  # persistent MOSEK models kept, one per problem shape
+    MAX_CACHED_SMOOTHINGS = 32  # smoothed alpha frames kept, per (frame, half-life)
+
+    def __init__(self, risk_budget=0.01, gme_limit=2, solver="mosek", risk_model="diagonal", n_factors=10,
+                 metrics=None):
+        """
+        solver="mosek" solves each date with MOSEK Fusion; solver="diagonal"
+        uses the closed-form solve_long_short_diagonal, which needs no solver
+        licence and skips the eigendecomposition and Cholesky steps (only
+        valid with the diagonal risk model).
+
+        risk_model="diagonal" keeps only the variances of the lookback
+        alphas; risk_model="factor" keeps their correlations through an
+        `n_factors`-factor plus diagonal model (see factor_model), which the
+        MOSEK solver uses directly without forming an N x N matrix.
+
+        `metrics` is an optional PipelineMetrics (pipelineMetrics.py) that
+        receives the solve time and universe size of every date optimised
+        by optimise() or backtest(), and the dates skipped.
+        """
+        if solver not in self.SOLVERS:
+            raise ValueError(f"Unknown solver {solver!r}; expected one of {self.SOLVERS}")
+        if risk_model not in self.RISK_MODELS:
+            raise ValueError(f"Unknown risk model {risk_model!r}; expected one of {self.RISK_MODELS}")
+        if solver == "diagonal" and risk_model != "diagonal":
+            raise ValueError("The diagonal solver only supports risk_model='diagonal'.")
         self.risk_budget = risk_budget
         self.gme_limit = gme_limit
+        self.solver = solver
+        self.risk_model = risk_model
+        self.n_factors = n_factors
         self.lookback_cov = 100 # days of cached alphas used to optimize
+        self.models = OrderedDict()  # problem shape -> _LongShortModel
+        self.smoothing_cache = OrderedDict()  # (frame fingerprint, halflife) -> smoothed frame
+        self.metrics = metrics
 
-    def optimise(self,all_dates,i,alpha_cache):
+    def __enter__(self):
+        return self
 
-        
-        hist_dates = all_dates[i - self.lookback_cov: i]
-        
-        alpha_hist = alpha_cache.loc[hist_dates].dropna(axis=1, how='any')
-        alpha_hist = alpha_hist.apply(pd.to_numeric, errors='coerce')
+    def __exit__(self, *exc):
+        self.close()
 
-        C_df = alpha_hist.cov()
-        C_df = C_df.loc[(C_df != 0).any(axis=1), (C_df != 0).any(axis=0)]
-        common_syms = alpha_hist.columns.intersection(C_df.columns)
-        alpha_hist = alpha_hist[common_syms]
-        C_df = C_df.loc[common_syms, common_syms]
-        C_df *= 252
+    def __getstate__(self):
+        # MOSEK models cannot be pickled; each process builds its own
+        state = self.__dict__.copy()
+        state["models"] = OrderedDict()
+        state["smoothing_cache"] = OrderedDict()
+        state["metrics"] = None  # workers' solve times are sent back and recorded by the parent
+        return state
 
-        # Zero out off-diagonal covariance elements here
-        C_df = pd.DataFrame(np.diag(np.diag(C_df)), index=C_df.index, columns=C_df.columns)
+    def close(self):
+        """Disposes the persistent MOSEK models."""
+        while self.models:
+            self.models.popitem()[1].close()
 
-        alpha_today_series = alpha_cache.loc[d, common_syms].dropna()
-        common_syms = C_df.columns.intersection(alpha_today_series.index)
-        C_df = C_df.loc[common_syms, common_syms]
+    def optimise(self,all_dates,i,alpha_cache,engine=None):
+        """
+        Weights for all_dates[i] from that date's alphas and the risk model
+        of the `lookback_cov` dates before it. Pass a RollingCovariance built
+        over alpha_cache (whose index all_dates should be) to update the
+        variances incrementally instead of recomputing them on every call.
+        """
+        d = all_dates[i]
+        alpha_hist = None
+        if engine is not None and engine.lookback != self.lookback_cov:
+            raise ValueError(f"Engine lookback {engine.lookback} does not match lookback_cov {self.lookback_cov}.")
+        if engine is None:
+            hist_dates = all_dates[i - self.lookback_cov: i]
+
+            alpha_hist = alpha_cache.loc[hist_dates].dropna(axis=1, how='any')
+            alpha_hist = alpha_hist.apply(pd.to_numeric, errors='coerce')
+
+        if self.risk_model == "factor":
+            if alpha_hist is None:
+                alpha_hist = engine.window_frame(d)
+            # Same universe as the covariance filter below, without the N x N matrix
+            variances = alpha_hist.var()
+            variances = variances[variances != 0]
+        elif engine is None:
+            C_df = alpha_hist.cov()
+            C_df = C_df.loc[(C_df != 0).any(axis=1), (C_df != 0).any(axis=0)]
+            common_syms = alpha_hist.columns.intersection(C_df.columns)
+            C_df = C_df.loc[common_syms, common_syms]
+            variances = pd.Series(np.diag(C_df), index=common_syms)
+        else:
+            variances = engine.variances(d)
+        variances *= 252
+
+        # The diagonal risk model zeroes the off-diagonal covariance elements
+        alpha_today_series = alpha_cache.loc[d, variances.index].dropna()
+        common_syms = variances.index.intersection(alpha_today_series.index)
+        variances = variances.loc[common_syms]
         alpha_today_series = alpha_today_series.loc[common_syms]
 
         if len(common_syms) == 0:
             print(f"Skipping {d} - no valid symbols after cleanup.")
+            self._record_skip("no_symbols")
             return None
-        
-        C = Optimizer.nearest_psd(A=C_df)
-        C_df = pd.DataFrame(C, index=C_df.index, columns=C_df.columns)
-        
+
         alpha_for_opt = alpha_today_series.values
-        C_for_opt = C_df.values
 
+        factors = None
+        if self.risk_model == "factor":
+            factors, specific_variances = factor_model(alpha_hist[common_syms].values, self.n_factors)
+            factors, variances = factors * np.sqrt(252), pd.Series(specific_variances * 252, index=common_syms)
+
+        start = time.perf_counter()
         try:
-            wts = Optimizer.solve_long_short_portfolio(alpha_for_opt, C_for_opt)
+            wts = self.solve(alpha_for_opt, variances.values, factors=factors)
         except np.linalg.LinAlgError:
             print(f"Skipping {d} - covariance matrix inversion failed.")
+            self._record_skip("linalg_error")
             return None
+        self._record_solve(time.perf_counter() - start, len(common_syms))
 
         rec = {"date": d}
         rec.update(dict(zip(common_syms, wts)))
         return rec
 
+    def _record_solve(self, seconds, n_symbols):
+        if self.metrics is not None:
+            self.metrics.observe("solve_seconds", seconds, solver=self.solver, risk_model=self.risk_model)
+            self.metrics.inc("solved_dates_total", solver=self.solver, risk_model=self.risk_model)
+            self.metrics.inc("solved_symbols_total", n_symbols, solver=self.solver, risk_model=self.risk_model)
+
+    def _record_skip(self, reason):
+        if self.metrics is not None:
+            self.metrics.inc("skipped_dates_total", reason=reason)
+
+    def solve(self, alpha, variances, factors=None):
+        """
+        Weights for one date from its alphas and annualised risk model, with
+        the configured solver: the covariance is factors @ factors.T +
+        diag(variances), or just diag(variances) without factors.
+        """
+        # Same floor as nearest_psd applies to the eigenvalues of a diagonal matrix
+        epsilon = 1e-12
+        variances = np.clip(variances, epsilon, None) + epsilon
+        if factors is None:
+            if self.solver == "diagonal":
+                return self.solve_long_short_diagonal(alpha, variances)
+            factors = np.empty((len(alpha), 0))
+        return self.solve_long_short_factor(alpha, factors, variances)
+
+    def backtest(self, alpha_cache, dates=None, num_workers=None, chunksize=16, max_pending=None):
+        """
+        Runs optimise over `dates` (default: every date of alpha_cache with a
+        full lookback window) and returns the weights as a DataFrame of
+        dates x alpha_cache.columns. Symbols outside a date's universe are
+        NaN, as are the rows of dates that were skipped.
+
+        alpha_cache is converted once into a dense array plus validity mask;
+        the per-date universes and variances come from a RollingCovariance
+        in date order, and the solves are fanned out in chunks of `chunksize`
+        dates over `num_workers` processes (default: one per CPU; 1 solves
+        inline). At most `max_pending` chunks (default 2 * num_workers) are
+        in flight, and results are collected in date order, so the output
+        does not depend on the number of workers.
+        """
+        engine = RollingCovariance(alpha_cache, lookback=self.lookback_cov)
+        if dates is None:
+            positions = np.arange(self.lookback_cov, len(engine.index))
+        else:
+            positions = np.sort(engine.index.get_indexer(pd.Index(dates)))
+            if (positions < 0).any():
+                raise ValueError("Every backtest date must be in the index of alpha_cache.")
+        num_workers = num_workers or os.cpu_count() or 1
+        max_pending = max_pending or 2 * num_workers
+
+        def problems():
+            for position in positions:
+                date = engine.index[position]
+                symbols, variances = engine.window(date)
+                today = engine.valid[position, symbols]
+                symbols = symbols[today]
+                factors = None
+                if self.risk_model == "factor":
+                    factors, variances = factor_model(engine.values[position - self.lookback_cov:position, symbols],
+                                                      self.n_factors)
+                    factors = factors * np.sqrt(252)
+                else:
+                    variances = variances[today]
+                yield (date, symbols, engine.values[position, symbols], variances * 252, factors)
+
+        problems = iter(problems())
+        chunks = iter(lambda: list(itertools.islice(problems, chunksize)), [])
+        weights = np.full((len(positions), len(engine.columns)), np.nan)
+
+        def chunk_results():
+            if num_workers <= 1:
+                for chunk in chunks:
+                    yield _solve_chunk(chunk, self)
+                return
+
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers, initializer=_init_backtest_worker, initargs=(self,)
+            ) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(_solve_chunk, chunk))
+                    if len(pending) >= max_pending:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+
+        row = 0
+        for results in chunk_results():
+            for symbols, wts, seconds in results:
+                if wts is not None:
+                    weights[row, symbols] = wts
+                    self._record_solve(seconds, len(symbols))
+                else:
+                    self._record_skip("no_symbols" if len(symbols) == 0 else "linalg_error")
+                row += 1
+
+        return pd.DataFrame(weights, index=engine.index[positions], columns=engine.columns)
 
     def solve_long_short_portfolio(self, alpha: np.ndarray, C: np.ndarray) -> np.ndarray:
         """
         Solve a long-short, market-neutral portfolio optimization:
         maximize alpha' x
-        subject to sum(x)=0, || L*x ||_2 <= risk_budget, sum(|x|) <= gme_limit
+        subject to sum(x)=0, || L'*x ||_2 <= risk_budget, sum(|x|) <= gme_limit
+        where C = L*L'.
+
+        The MOSEK model for each universe size is built once and kept (see
+        close()); later calls only update its parameters and re-solve.
 
         :param alpha: (N,) array of signals
         :param C: (N, N) covariance matrix
@@ -79,29 +259,185 @@ class Optimizer:
             # Covariance matrix not PSD, return zero weights
             return np.zeros(N)
 
-        with Model("LongShortPortfolio") as M:
-            x = M.variable("x", N, Domain.inRange(-1, 1))
+        return self._model(N).solve(alpha, self.risk_budget, self.gme_limit, factor=L.T)
+
+    def solve_long_short_factor(self, alpha: np.ndarray, factors: np.ndarray,
+                                specific_variances: np.ndarray) -> np.ndarray:
+        """
+        solve_long_short_portfolio for a covariance given as
+        C = F*F' + diag(d), with the risk constraint written on the factor
+        structure directly:
+        || (F'*x, d^(1/2) * x) ||_2 <= risk_budget
+        so nothing of size N x N is formed or factorised; the model holds
+        N*(k + 1) risk coefficients. The model for each (N, k) is built once
+        and kept, as for solve_long_short_portfolio.
+
+        :param alpha: (N,) array of signals
+        :param factors: (N, k) factor loadings F, k may be 0
+        :param specific_variances: (N,) array of non-negative specific variances d
+        :return: (N,) array of optimized weights
+        """
+        alpha = np.asarray(alpha, dtype=np.float64)
+        factors = np.asarray(factors, dtype=np.float64)
+        specific_variances = np.asarray(specific_variances, dtype=np.float64)
+
+        if alpha.ndim != 1:
+            raise ValueError(f"alpha must be a 1D array, but got shape {alpha.shape}.")
+
+        N = alpha.size
+        if factors.ndim != 2 or factors.shape[0] != N:
+            raise ValueError(f"Factor loadings shape {factors.shape} does not match alpha size {N}.")
+        if specific_variances.shape != (N,):
+            raise ValueError(f"Specific variances shape {specific_variances.shape} does not match alpha size {N}.")
+        if np.any(specific_variances < 0):
+            raise ValueError("Specific variances must be non-negative.")
+
+        k = factors.shape[1]
+        return self._model(N, k).solve(alpha, self.risk_budget, self.gme_limit,
+                                       factor=factors.T if k else None,
+                                       specific_volatility=np.sqrt(specific_variances))
+
+    def _model(self, N, n_factors=None):
+        key = (N, n_factors)
+        model = self.models.pop(key, None)
+        if model is None:
+            model = _LongShortModel(N, n_factors)
+            if len(self.models) >= self.MAX_CACHED_MODELS:
+                self.models.popitem(last=False)[1].close()
+        self.models[key] = model  # most recently used last
+        return model
+
+    def solve_long_short_diagonal(self, alpha: np.ndarray, variances: np.ndarray) -> np.ndarray:
+        """
+        Same problem as solve_long_short_portfolio for a diagonal covariance
+        C = diag(variances), solved without a conic solver:
+        maximize alpha' x
+        subject to sum(x)=0, sum(variances * x**2) <= risk_budget**2,
+                   sum(|x|) <= gme_limit, -1 <= x <= 1
+
+        Apart from sum(x)=0 the problem separates by name. For multipliers
+        mu (neutrality), nu (GME) and lambda (risk) the KKT conditions give
+        x_i = soft(alpha_i - mu, nu) / (2 * lambda * variances_i), clipped to
+        the box, where soft(v, nu) = sign(v) * max(|v| - nu, 0). mu is found
+        exactly from the piecewise-linear neutrality condition, lambda then
+        follows in closed form from the risk budget, and nu is bisected
+        until the GME limit holds. Only when the box binds does it fall back
+        to bisecting lambda as well. Runs in O(N log N) per bisection step.
+
+        :param alpha: (N,) array of signals
+        :param variances: (N,) array of strictly positive variances
+        :return: (N,) array of optimized weights
+        """
+        alpha = np.asarray(alpha, dtype=np.float64)
+        variances = np.asarray(variances, dtype=np.float64)
+
+        if alpha.ndim != 1:
+            raise ValueError(f"alpha must be a 1D array, but got shape {alpha.shape}.")
+
+        N = alpha.size
+        if variances.shape != (N,):
+            raise ValueError(f"Variances shape {variances.shape} does not match alpha size {N}.")
+        if not np.all(variances > 0):
+            raise ValueError("Variances must be strictly positive.")
+
+        spread = alpha.max() - alpha.min() if N else 0.0
+        if N < 2 or spread <= 0 or self.gme_limit <= 0 or self.risk_budget <= 0:
+            # Neutrality leaves nothing to trade
+            return np.zeros(N)
+
+        precision = 1.0 / variances
+        shifts = _NeutralShift(alpha, precision)
+
+        def direction(nu):
+            # Unscaled optimum for GME multiplier nu: x is a positive multiple of this
+            return _balance(precision * _soft_threshold(alpha - shifts.solve(nu), nu))
 
-            # Market neutrality constraint
-            M.constraint("market_neutral", Expr.sum(x), Domain.equalsTo(0.0))
+        def gme_to_risk(y):
+            return np.abs(y).sum() / np.sqrt(np.dot(variances, y * y))
 
-            # Objective function
-            M.objective("obj", ObjectiveSense.Maximize, Expr.dot(alpha, x))
+        y = direction(0.0)
+        target = self.gme_limit / self.risk_budget
+        if gme_to_risk(y) > target:
+            # The GME limit binds: raise nu until the risk-scaled portfolio fits.
+            # At nu = spread / 2 every name is thresholded away.
+            lo, hi = 0.0, spread / 2
+            while hi - lo > 1e-14 * spread:
+                nu = 0.5 * (lo + hi)
+                y_mid = direction(nu)
+                if np.any(y_mid) and gme_to_risk(y_mid) > target:
+                    lo = nu
+                else:
+                    hi = nu
+            y = direction(lo)
 
-            # Risk constraint
-            M.constraint("risk", Expr.vstack(Expr.constTerm(self.risk_budget), Expr.mul(L, x)), Domain.inQCone())
+        # Largest multiple within both budgets; the GME limit binds on its own
+        # when even the most concentrated (LP) portfolio is within risk
+        scale = min(self.risk_budget / np.sqrt(np.dot(variances, y * y)),
+                    self.gme_limit / np.abs(y).sum())
+        x = scale * y
+        if np.abs(x).max() <= 1.0:
+            return x
+        return self._solve_long_short_diagonal_boxed(alpha, variances, spread)
+
+    def _solve_long_short_diagonal_boxed(self, alpha, variances, spread):
+        """
+        Fallback of solve_long_short_diagonal for when a position hits the
+        [-1, 1] box. If the risk budget is slack at the optimum, the problem
+        is the LP without the risk constraint, solved by _boxed_long_short_lp.
+        Otherwise the risk multiplier lambda is positive and, with t = 2 * lambda,
+        x = clip(soft(alpha - mu, nu) / (t * variances), -1, 1) maximises
+        alpha' x - t / 2 * risk over the neutral, boxed portfolios within the
+        GME limit. Its gross exposure is non-increasing in nu for a fixed t,
+        and its risk non-increasing in t, so nu is bisected for each trial t
+        and t is bisected until the risk budget holds. Neutrality is solved
+        exactly for every (t, nu).
+        """
+        budget = self.risk_budget ** 2
 
-            # Gross Market Exposure constraint
-            t = M.variable("t", N, Domain.greaterThan(0.0))
-            M.constraint("abs_pos", Expr.sub(t, x), Domain.greaterThan(0.0))
-            M.constraint("abs_neg", Expr.sub(t, Expr.neg(x)), Domain.greaterThan(0.0))
-            M.constraint("gme_constraint", Expr.sum(t), Domain.lessThan(self.gme_limit))
+        x = _boxed_long_short_lp(alpha, self.gme_limit)
+        if np.dot(variances, x * x) <= budget:
+            return x
 
-            M.solve()
+        def positions(t, nu):
+            width = t * variances
+            mu = _clipped_neutral_shift(alpha, width, nu)
+            return _balance(np.clip(_soft_threshold(alpha - mu, nu) / width, -1.0, 1.0))
 
-            return np.array(x.level())
+        def within_gme(t):
+            # Smallest nu (largest positions) that keeps the GME within its limit
+            x = positions(t, 0.0)
+            if np.abs(x).sum() <= self.gme_limit:
+                return x
+            lo, hi = 0.0, spread / 2
+            x_hi = np.zeros_like(alpha)
+            while hi - lo > 1e-15 * spread:
+                nu = 0.5 * (lo + hi)
+                x = positions(t, nu)
+                if np.abs(x).sum() > self.gme_limit:
+                    lo = nu
+                else:
+                    hi, x_hi = nu, x
+                    if np.abs(x).sum() >= self.gme_limit * (1 - 1e-12):
+                        break
+            return x_hi
 
+        def risk(x):
+            return np.dot(variances, x * x)
 
+        hi = spread / variances.min()  # every position below 1 in absolute value
+        x_hi = within_gme(hi)
+        while risk(x_hi) > budget:
+            hi *= 2
+            x_hi = within_gme(hi)
+        lo = hi * 1e-12
+        while hi - lo > 1e-12 * hi:
+            t = 0.5 * (lo + hi)
+            x = within_gme(t)
+            if risk(x) > budget:
+                lo = t
+            else:
+                hi, x_hi = t, x
+        return x_hi
 
     def nearest_psd(self,A, epsilon=1e-12):
         """
@@ -114,18 +450,424 @@ class Optimizer:
         A_sym = 0.5 * (A + A.T)
         eigvals, eigvecs = np.linalg.eigh(A_sym)
         eigvals_clipped = np.clip(eigvals, a_min=epsilon, a_max=None)
-        A_psd = eigvecs @ np.diag(eigvals_clipped) @ eigvecs.T
+        A_psd = (eigvecs * eigvals_clipped) @ eigvecs.T
         A_psd = 0.5 * (A_psd + A_psd.T)
         A_psd += np.eye(A_psd.shape[0]) * epsilon
         return A_psd
 
     def smooth_alpha_cache(self, alpha_cache, halflife):
-        smoothed_df = alpha_cache.copy()
-        alpha = 1 - np.exp(np.log(0.5) / halflife)
+        """
+        Exponentially weighted mean of every column with the given half-life,
+        identical to Series.ewm(alpha=..., adjust=False).mean() per column.
+        """
+        return self.smooth_alpha_sweep(alpha_cache, [halflife])[halflife]
+
+    def smooth_alpha_sweep(self, alpha_cache, halflives):
+        """
+        smooth_alpha_cache for several half-lives, returned as a dict keyed by
+        half-life. The half-lives not yet cached for this alpha_cache (matched
+        by a fingerprint of its contents) are smoothed together in one pass
+        over the rows; the returned frames are copies, free to modify.
+        """
+        fingerprint = frame_fingerprint(alpha_cache)
+        missing = [halflife for halflife in dict.fromkeys(halflives)
+                   if (fingerprint, halflife) not in self.smoothing_cache]
+        if missing:
+            alphas = [1 - np.exp(np.log(0.5) / halflife) for halflife in missing]
+            smoothed = ewm_mean(alpha_cache.to_numpy(dtype=np.float64), alphas)
+            for halflife, values in zip(missing, smoothed):
+                self.smoothing_cache[(fingerprint, halflife)] = pd.DataFrame(
+                    values, index=alpha_cache.index, columns=alpha_cache.columns
+                )
+                while len(self.smoothing_cache) > self.MAX_CACHED_SMOOTHINGS:
+                    self.smoothing_cache.popitem(last=False)
+
+        results = {}
+        for halflife in halflives:
+            self.smoothing_cache.move_to_end((fingerprint, halflife))
+            results[halflife] = self.smoothing_cache[(fingerprint, halflife)].copy()
+        return results
+
+    
+
+class RollingCovariance:
+    """
+    Covariance of alpha_cache over the `lookback` rows before each date, as
+    Optimizer.optimise computes it, kept as running sums that move forward
+    one row at a time instead of being recomputed from the whole window.
+
+    A symbol is part of a window only if it has a value on every row of it
+    and is not constant over it (matching optimise's dropna / zero-variance
+    filters); per-symbol counts of valid rows and of value changes track
+    symbols entering and leaving the universe. Sums are kept relative to a
+    per-symbol shift taken at the last full recompute, which happens on any
+    non-consecutive request and every `recompute_every` steps to bound the
+    rounding drift. mode="diagonal" keeps only the variances, O(N) per step;
+    mode="full" keeps the cross-products too, O(N^2) per step.
+    """
+    MODES = ("diagonal", "full")
+
+    def __init__(self, alpha_cache, lookback=100, mode="diagonal", recompute_every=250):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown mode {mode!r}; expected one of {self.MODES}")
+        frame = alpha_cache.apply(pd.to_numeric, errors='coerce')
+        self.index = frame.index
+        self.columns = frame.columns
+        self.lookback = lookback
+        self.mode = mode
+        self.recompute_every = recompute_every
+
+        values = frame.to_numpy(dtype=np.float64, copy=True)
+        self.valid = np.isfinite(values)
+        values[~self.valid] = 0.0
+        self.values = values
+        # changed[t] is True where a symbol's value differs from the row before
+        self.changed = np.zeros_like(self.valid)
+        self.changed[1:] = self.valid[1:] & self.valid[:-1] & (values[1:] != values[:-1])
+
+        self.end = None  # window covers rows [end - lookback, end)
+
+    def variances(self, date):
+        """Sample variances (ddof=1) of the eligible symbols in the window before `date`."""
+        symbols, variances = self.window(date)
+        return pd.Series(variances, index=self.columns[symbols])
+
+    def window(self, date):
+        """
+        Array form of variances(): the column positions of the eligible
+        symbols and their sample variances.
+        """
+        end, eligible = self._advance(date)
+        if end is None:
+            return np.array([], dtype=np.intp), np.array([], dtype=np.float64)
+        sum_sq = np.diag(self.sum_sq) if self.mode == "full" else self.sum_sq
+        symbols = np.flatnonzero(eligible)
+        sums = self.sums[symbols]
+        return symbols, (sum_sq[symbols] - sums ** 2 / self.lookback) / (self.lookback - 1)
+
+    def window_frame(self, date):
+        """The lookback rows before `date` of the eligible symbols, as a DataFrame."""
+        symbols, _ = self.window(date)
+        if len(symbols) == 0:
+            return pd.DataFrame(dtype=np.float64)
+        rows = slice(self.end - self.lookback, self.end)
+        return pd.DataFrame(self.values[rows, symbols], index=self.index[rows], columns=self.columns[symbols])
+
+    def covariance(self, date):
+        """Sample covariance (ddof=1) of the eligible symbols in the window before `date`."""
+        if self.mode != "full":
+            raise ValueError("covariance() needs a RollingCovariance built with mode='full'.")
+        end, eligible = self._advance(date)
+        if end is None:
+            return pd.DataFrame(dtype=np.float64)
+        sums = self.sums[eligible]
+        C = (self.sum_sq[np.ix_(eligible, eligible)] - np.outer(sums, sums) / self.lookback) / (self.lookback - 1)
+        symbols = self.columns[eligible]
+        return pd.DataFrame(C, index=symbols, columns=symbols)
+
+    def _advance(self, date):
+        end = self.index.get_loc(date)
+        if end < self.lookback:
+            return None, None
+        if self.end is not None and end == self.end + 1 and self.steps < self.recompute_every:
+            self._step()
+        elif end != self.end:
+            self._recompute(end)
+        eligible = (self.counts == self.lookback) & (self.change_counts > 0)
+        return end, eligible
+
+    def _recompute(self, end):
+        rows = slice(end - self.lookback, end)
+        valid = self.valid[rows]
+        self.counts = valid.sum(axis=0)
+        self.shift = self.values[rows].sum(axis=0) / np.maximum(self.counts, 1)
+        x = (self.values[rows] - self.shift) * valid
+        self.sums = x.sum(axis=0)
+        self.sum_sq = x.T @ x if self.mode == "full" else (x * x).sum(axis=0)
+        self.change_counts = self.changed[end - self.lookback + 1:end].sum(axis=0)
+        self.end = end
+        self.steps = 0
+
+    def _step(self):
+        # Row `end` enters the window, row `end - lookback` leaves it
+        self._update(self.end, 1)
+        self._update(self.end - self.lookback, -1)
+        self.change_counts += self.changed[self.end].astype(np.int64) - self.changed[self.end - self.lookback + 1]
+        self.end += 1
+        self.steps += 1
+
+    def _update(self, row, sign):
+        x = (self.values[row] - self.shift) * self.valid[row]
+        self.counts += sign * self.valid[row]
+        self.sums += sign * x
+        if self.mode == "full":
+            self.sum_sq += sign * np.outer(x, x)
+        else:
+            self.sum_sq += sign * x * x
+
+
+class _LongShortModel:
+    """
+    The MOSEK Fusion model of solve_long_short_portfolio for one universe
+    size, built once. Alpha, the covariance factor and both budgets are
+    parameters, so a rebalance sets new values and re-solves without
+    rebuilding variables or constraints.
+
+    With n_factors=None the risk cone holds a dense (N, N) factor L' with
+    C = L*L'; otherwise it holds the (n_factors, N) loadings F' and the
+    specific volatilities of solve_long_short_factor.
+    """
+    def __init__(self, N, n_factors=None):
+        from mosek.fusion import Model, Expr, Domain, ObjectiveSense
+
+        self.M = M = Model("LongShortPortfolio")
+        self.alpha = M.parameter("alpha", N)
+        self.factor = None
+        self.specific_volatility = None
+        if n_factors is None:
+            self.factor = M.parameter("factor", [N, N])
+        else:
+            if n_factors:
+                self.factor = M.parameter("factor", [n_factors, N])
+            self.specific_volatility = M.parameter("specific_volatility", N)
+        self.risk_budget = M.parameter("risk_budget")
+        self.gme_limit = M.parameter("gme_limit")
+
+        self.x = x = M.variable("x", N, Domain.inRange(-1, 1))
+
+        # Market neutrality constraint
+        M.constraint("market_neutral", Expr.sum(x), Domain.equalsTo(0.0))
+
+        # Objective function
+        M.objective("obj", ObjectiveSense.Maximize, Expr.dot(self.alpha, x))
+
+        # Risk constraint
+        risk_terms = [self.risk_budget]
+        if self.factor is not None:
+            risk_terms.append(Expr.mul(self.factor, x))
+        if self.specific_volatility is not None:
+            risk_terms.append(Expr.mulElm(self.specific_volatility, x))
+        M.constraint("risk", Expr.vstack(risk_terms), Domain.inQCone())
+
+        # Gross Market Exposure constraint
+        t = M.variable("t", N, Domain.greaterThan(0.0))
+        M.constraint("abs_pos", Expr.sub(t, x), Domain.greaterThan(0.0))
+        M.constraint("abs_neg", Expr.sub(t, Expr.neg(x)), Domain.greaterThan(0.0))
+        M.constraint("gme_constraint", Expr.sub(Expr.sum(t), self.gme_limit), Domain.lessThan(0.0))
+
+    def solve(self, alpha, risk_budget, gme_limit, factor=None, specific_volatility=None):
+        self.alpha.setValue(alpha)
+        if self.factor is not None:
+            self.factor.setValue(factor)
+        if self.specific_volatility is not None:
+            self.specific_volatility.setValue(specific_volatility)
+        self.risk_budget.setValue(risk_budget)
+        self.gme_limit.setValue(gme_limit)
+        # No warm start: MOSEK's interior-point optimizer ignores initial levels
+        self.M.solve()
+        return np.array(self.x.level())
+
+    def close(self):
+        self.M.dispose()
+
+
+def factor_model(window, n_factors, epsilon=1e-12):
+    """
+    k-factor plus diagonal approximation of the sample covariance (ddof=1)
+    of a (L, N) window of alphas: the top `n_factors` principal components
+    of the centred window, from a thin SVD, give the loadings F (N, k), and
+    what they leave of each symbol's variance is its specific variance,
+    floored at epsilon. F @ F.T + diag(d) therefore keeps the sample
+    variances on its diagonal. Costs O(L^2 N) rather than O(N^3).
+
+    Returns (F, d).
+    """
+    window = np.asarray(window, dtype=np.float64)
+    X = (window - window.mean(axis=0)) / np.sqrt(window.shape[0] - 1)
+    k = min(n_factors, *X.shape)
+    _, singular_values, vt = np.linalg.svd(X, full_matrices=False)
+    F = vt[:k].T * singular_values[:k]
+    specific_variances = np.clip((X * X).sum(axis=0) - (F * F).sum(axis=1), epsilon, None)
+    return F, specific_variances
+
+def ewm_mean(values, alphas):
+    """
+    Exponentially weighted means of the columns of a (T, N) array for each
+    smoothing factor in `alphas`, as a (len(alphas), T, N) array. Matches
+    pandas' ewm(alpha=a, adjust=False).mean() bit for bit, including NaN
+    handling: values stay NaN until a column's first observation, gaps carry
+    the last mean forward, and the weight of the old mean keeps decaying
+    through a gap. All columns and factors advance together, one row at a
+    time.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    T, N = values.shape
+    # pandas converts alpha to a centre of mass and back, and with com == 1
+    # (alpha = 0.5) weights new observations by 1 - old_wt instead
+    alphas = np.asarray(alphas, dtype=np.float64)[:, None]
+    com = (1 - alphas) / alphas
+    new_wt = 1.0 / (1.0 + com)
+    old_wt_factor = 1.0 - new_wt
+    com_is_one = com == 1
+    any_com_is_one = com_is_one.any()
+
+    output = np.empty((new_wt.shape[0], T, N))
+    if T == 0:
+        return output
+    weighted = np.repeat(values[:1], new_wt.shape[0], axis=0)
+    old_wt = np.ones_like(weighted)
+    output[:, 0] = weighted
+    for i in range(1, T):
+        cur = values[i]
+        is_observation = ~np.isnan(cur)
+        started = ~np.isnan(weighted)
+        old_wt = np.where(started, old_wt * old_wt_factor, old_wt)
+        if any_com_is_one:
+            new_wt = np.where(com_is_one, 1.0 - old_wt, new_wt)
+        update = started & is_observation
+        # As pandas: skip the update when nothing changes, to avoid rounding drift on constant series
+        blend = update & (weighted != cur)
+        with np.errstate(invalid="ignore"):
+            blended = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+        weighted = np.where(blend, blended, weighted)
+        old_wt = np.where(update, 1.0, old_wt)
+        weighted = np.where(~started & is_observation, cur, weighted)
+        output[:, i] = weighted
+    return output
+
+def frame_fingerprint(frame):
+    """Digest of a DataFrame's index, columns and values, to key caches by content."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(frame.shape).encode())
+    digest.update(pd.util.hash_pandas_object(frame.index).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(frame.columns.to_series(), index=False).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+# Optimizer of the current backtest worker process, set by _init_backtest_worker
+_BACKTEST_OPTIMIZER = None
+
+def _init_backtest_worker(optimizer):
+    global _BACKTEST_OPTIMIZER
+    _BACKTEST_OPTIMIZER = optimizer
+
+def _solve_chunk(problems, optimizer=None):
+    """
+    Solves a chunk of (date, symbols, alpha, variances, factors) problems and
+    returns (symbols, weights, solve seconds) for each; None weights mark a
+    skipped date.
+    """
+    optimizer = optimizer or _BACKTEST_OPTIMIZER
+    results = []
+    for date, symbols, alpha, variances, factors in problems:
+        wts = None
+        start = time.perf_counter()
+        if len(symbols) == 0:
+            print(f"Skipping {date} - no valid symbols after cleanup.")
+        else:
+            try:
+                wts = optimizer.solve(alpha, variances, factors=factors)
+            except np.linalg.LinAlgError:
+                print(f"Skipping {date} - covariance matrix inversion failed.")
+        results.append((symbols, wts, time.perf_counter() - start))
+    return results
+
+
+def _soft_threshold(values, nu):
+    return np.sign(values) * np.maximum(np.abs(values) - nu, 0.0)
+
+
+def _balance(x):
+    """
+    Scales the heavier side of a long/short vector down to the lighter one,
+    so sum(x) = 0 holds to rounding even where the neutral shift is only
+    known to a few digits relative to the tiny positions left near the LP
+    limit. Never increases a position, so budgets and the box still hold.
+    """
+    longs = x[x > 0].sum()
+    shorts = -x[x < 0].sum()
+    if longs <= 0 or shorts <= 0:
+        return np.zeros_like(x)
+    if longs > shorts:
+        return np.where(x > 0, x * (shorts / longs), x)
+    return np.where(x < 0, x * (longs / shorts), x)
+
+
+class _NeutralShift:
+    """
+    Solves sum_i w_i * soft(alpha_i - mu, nu) = 0 for mu exactly. The sum
+    is piecewise linear and non-increasing in mu with kinks at alpha +/- nu,
+    so it is evaluated at every kink via prefix sums over the sorted alphas
+    and the root interpolated inside the bracketing segment.
+    """
+    def __init__(self, alpha, weights):
+        order = np.argsort(alpha, kind="stable")
+        self.alpha = alpha[order]
+        weights = weights[order]
+        self.cum_w = np.concatenate(([0.0], np.cumsum(weights)))
+        self.cum_wa = np.concatenate(([0.0], np.cumsum(weights * self.alpha)))
+
+    def value(self, mu, nu):
+        # Names with alpha - nu > mu contribute w * (alpha - nu - mu),
+        # names with alpha + nu < mu contribute w * (alpha + nu - mu)
+        upper = np.searchsorted(self.alpha - nu, mu, side="right")
+        lower = np.searchsorted(self.alpha + nu, mu, side="left")
+        w_upper = self.cum_w[-1] - self.cum_w[upper]
+        wa_upper = self.cum_wa[-1] - self.cum_wa[upper]
+        return (wa_upper - (nu + mu) * w_upper) + (self.cum_wa[lower] + (nu - mu) * self.cum_w[lower])
+
+    def solve(self, nu):
+        kinks = np.concatenate((self.alpha - nu, self.alpha + nu))
+        values = self.value(kinks, nu)
+        positive = values > 0
+        above = ~positive
+        hi = kinks[above].min()
+        if not positive.any():
+            return hi
+        h_hi = values[above][kinks[above].argmin()]
+        lo = kinks[positive].max()
+        h_lo = values[positive][kinks[positive].argmax()]
+        return lo + h_lo * (hi - lo) / (h_lo - h_hi)
+
+
+def _boxed_long_short_lp(alpha, gme_limit):
+    """
+    Solves max alpha' x subject to sum(x)=0, sum(|x|) <= gme_limit and
+    -1 <= x <= 1. The long and the short side each hold gme_limit / 2, so
+    the k-th best long is paired with the k-th best short for as long as
+    the pair adds alpha; the last pair may hold a fractional position.
+    """
+    order = np.argsort(alpha, kind="stable")
+    pairs = alpha.size // 2
+    longs, shorts = order[::-1][:pairs], order[:pairs]
+    sizes = np.clip(gme_limit / 2 - np.arange(pairs), 0.0, 1.0)
+    sizes[alpha[longs] <= alpha[shorts]] = 0.0
+    x = np.zeros_like(alpha)
+    x[longs] = sizes
+    x[shorts] = -sizes
+    return x
 
-        for col in smoothed_df.columns:
-            smoothed_df[col] = smoothed_df[col].ewm(alpha=alpha, adjust=False).mean()
 
-        return smoothed_df
+def _clipped_neutral_shift(alpha, width, nu):
+    """
+    Solves sum_i clip(soft(alpha_i - mu, nu) / width_i, -1, 1) = 0 for mu
+    exactly: the sum is piecewise linear and non-increasing in mu, so the
+    segment holding the root is found by bisecting over its sorted kinks.
+    """
+    def total(mu):
+        return np.clip(_soft_threshold(alpha - mu, nu) / width, -1.0, 1.0).sum()
 
-    
\ No newline at end of file
+    kinks = np.sort(np.concatenate((alpha - nu - width, alpha - nu, alpha + nu, alpha + nu + width)))
+    # Positions sum to +N left of the first kink and -N right of the last one
+    lo, hi = 0, kinks.size - 1
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if total(kinks[mid]) > 0:
+            lo = mid
+        else:
+            hi = mid
+    f_lo, f_hi = total(kinks[lo]), total(kinks[hi])
+    if f_hi == 0:
+        return kinks[hi]
+    return kinks[lo] + f_lo * (kinks[hi] - kinks[lo]) / (f_lo - f_hi)
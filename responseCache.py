@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+
+CachedResponse = namedtuple(
+    "CachedResponse", ["url", "url_class", "digest", "etag", "last_modified", "fetched_at"]
+)
+
+class ResponseCache:
+    """
+    Content-addressed, gzip-compressed on-disk cache of fetched HTML.
+
+    Bodies live under `cache_dir/objects/` named by the SHA-256 of their
+    content, so identical pages are stored once; `cache_dir/index.db` maps
+    each URL to its body plus the ETag / Last-Modified validators sent by
+    the server.
+
+    Entries expire after a TTL that depends on the URL class ("listing" or
+    "article" by default; None means never). Expired entries are
+    revalidated with a conditional request rather than downloaded again.
+    With offline=True the network is never used: cached bodies are served
+    regardless of age, which lets the extraction logic be re-run at disk
+    speed.
+    """
+    DEFAULT_TTLS = {
+        "listing": 60 * 60,  # listing pages change as new articles are published
+        "article": None,     # published articles practically never change
+    }
+
+    def __init__(self, cache_dir, ttls=None, offline=False):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.offline = offline
+
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.db"))
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                url_class TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def lookup(self, url):
+        """Returns the CachedResponse for `url`, or None if it was never stored."""
+        row = self.conn.execute(
+            "SELECT url, url_class, digest, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+            (url,)
+        ).fetchone()
+        return CachedResponse(*row) if row else None
+
+    def is_fresh(self, entry):
+        """True if `entry` is younger than the TTL of its URL class."""
+        ttl = self.ttls.get(entry.url_class)
+        return ttl is None or time.time() - entry.fetched_at < ttl
+
+    def read(self, entry):
+        """
+        Returns the decoded body of a cached response, or None if its object
+        is missing or corrupt. A broken object is removed along with the
+        index rows pointing to it, so those URLs are treated as cache misses.
+        """
+        path = self._object_path(entry.digest)
+        try:
+            with gzip.open(path, "rb") as f:
+                return f.read().decode("utf-8")
+        except (OSError, EOFError, zlib.error, UnicodeDecodeError) as e:
+            print(f"[ERROR] Dropping unreadable cache object for {entry.url}: {e}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self.conn:
+            self.conn.execute("DELETE FROM responses WHERE digest = ?", (entry.digest,))
+        return None
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Request headers that revalidate `entry` (If-None-Match / If-Modified-Since)."""
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url, url_class, text, etag=None, last_modified=None):
+        """Stores a freshly downloaded body and its validators for `url`."""
+        body = text.encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                f.write(body)
+            os.replace(tmp_path, path)  # atomic, so readers never see a partial object
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (url, url_class, digest, etag, last_modified, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, url_class, digest, etag, last_modified, time.time())
+            )
+
+    def touch(self, url):
+        """Marks a cached response as revalidated (e.g. after a 304 Not Modified)."""
+        with self.conn:
+            self.conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def urls(self, url_class=None):
+        """Lists cached URLs, optionally only those of one URL class."""
+        if url_class is None:
+            rows = self.conn.execute("SELECT url FROM responses ORDER BY url")
+        else:
+            rows = self.conn.execute("SELECT url FROM responses WHERE url_class = ? ORDER BY url", (url_class,))
+        return [row[0] for row in rows]
+
+    def prune(self):
+        """Deletes stored bodies no longer referenced by any URL. Returns how many were removed."""
+        referenced = {row[0] for row in self.conn.execute("SELECT DISTINCT digest FROM responses")}
+        removed = 0
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                if name.endswith(".gz") and name[:-3] not in referenced:
+                    os.remove(os.path.join(prefix_dir, name))
+                    removed += 1
+        return removed
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.gz")
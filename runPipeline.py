@@ -0,0 +1,410 @@
+"""
+End-to-end pipeline: scrape -> disclaimer cleaning -> NER masking -> token cleaning.
+
+Each stage's output is stored per document in a SQLite StageStore, keyed by
+the document's content and the configuration of that stage and of every
+stage before it. A rerun only processes the documents (and the stages)
+whose key is not in the store yet: new or edited articles, or every article
+from the first changed stage on when a stage's configuration changes.
+
+Usage:
+    python runPipeline.py --articles morningstar_equity_research2.csv --output articles_clean.parquet
+    python runPipeline.py --scrape 1 5 --articles articles.parquet --output articles_clean.parquet --metrics run.prom
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+from articleSinks import make_sink, read_articles
+from nearDuplicates import NearDuplicateIndex
+from pipelineMetrics import PipelineMetrics, write_metrics
+from scrapeMorningStar import scrape_and_append_to_csv
+
+def content_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def chain_key(fingerprint, key):
+    """Key of a stage's output: its configuration fingerprint chained onto the key of its input."""
+    return hashlib.blake2b(fingerprint.encode("utf-8") + key, digest_size=16).digest()
+
+class StageStore:
+    """
+    Persistent per-document outputs of the pipeline stages, in a SQLite file.
+
+    Outputs are stored as zlib-compressed text under (stage, key), where key
+    is a chain_key: it is derived from the raw document and the fingerprints
+    of the stages up to this one, never from the intermediate texts, so the
+    final output of an unchanged document is found with a single lookup.
+    """
+    # SQLite's default limit on bound parameters is 999
+    QUERY_CHUNK = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS outputs (
+                stage TEXT NOT NULL,
+                key BLOB NOT NULL,
+                output BLOB NOT NULL,
+                stored_at REAL NOT NULL,
+                PRIMARY KEY (stage, key)
+            ) WITHOUT ROWID;
+            """
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, stage, keys):
+        """Returns {key: output} for the keys of `stage` that are stored."""
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), self.QUERY_CHUNK):
+            chunk = keys[start:start + self.QUERY_CHUNK]
+            rows = self.conn.execute(
+                f"SELECT key, output FROM outputs WHERE stage = ? AND key IN ({','.join('?' * len(chunk))})",
+                [stage, *chunk]
+            )
+            for key, output in rows:
+                found[key] = zlib.decompress(output).decode("utf-8")
+        return found
+
+    def put_many(self, stage, items):
+        """Stores (key, output) pairs for `stage` in one transaction."""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO outputs (stage, key, output, stored_at) VALUES (?, ?, ?, ?)",
+                ((stage, key, zlib.compress(output.encode("utf-8"), 6), now) for key, output in items)
+            )
+
+    def prune(self, stage, keep_keys):
+        """Deletes the outputs of `stage` whose key is not in `keep_keys`; returns how many."""
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (key BLOB PRIMARY KEY) WITHOUT ROWID")
+            self.conn.execute("DELETE FROM keep")
+            self.conn.executemany("INSERT OR IGNORE INTO keep (key) VALUES (?)", ((key,) for key in keep_keys))
+            deleted = self.conn.execute(
+                "DELETE FROM outputs WHERE stage = ? AND key NOT IN (SELECT key FROM keep)", (stage,)
+            ).rowcount
+            self.conn.execute("DELETE FROM keep")
+        return deleted
+
+class DisclaimerStage:
+    """
+    Removes the phrases of a DisclaimerPhraseModel
+    (textCleaning.process_documents_with_logging).
+    """
+    name = "disclaimers"
+    version = 1
+
+    def __init__(self, processor, phrase_model, num_workers=4, backend="processes"):
+        self.processor = processor
+        self.phrase_model = phrase_model
+        self.num_workers = num_workers
+        self.backend = backend
+
+    @property
+    def fingerprint(self):
+        return json.dumps([self.name, self.version, self.phrase_model.fingerprint])
+
+    def run(self, texts):
+        return self.processor.process_documents_with_logging(texts, self.phrase_model, num_threads=self.num_workers,
+                                                            backend=self.backend)
+
+class EntityStage:
+    """Masks ORG / PERSON / PRODUCT entities with spaCy (cleanNER.mask_entities_batch)."""
+    name = "entities"
+    version = 1
+
+    def __init__(self, model="en_core_web_sm", labels=None, batch_size=64, span_cache_path=None, metrics=None):
+        from clean import cleanNER
+
+        self.cleanNER = cleanNER
+        cleanNER.init_spacy(model)
+        self.model = cleanNER.model_key(cleanNER.nlp)
+        self.labels = tuple(labels or cleanNER.MASK_LABELS)
+        self.batch_size = batch_size
+        self.span_cache = cleanNER.EntitySpanCache(span_cache_path, self.model) if span_cache_path else None
+        self.metrics = metrics
+
+    @property
+    def fingerprint(self):
+        return json.dumps([self.name, self.version, self.model, sorted(self.labels)])
+
+    def run(self, texts):
+        return self.cleanNER.mask_entities_batch(texts, self.batch_size, self.labels, span_cache=self.span_cache,
+                                                 metrics=self.metrics)
+
+    def close(self):
+        if self.span_cache is not None:
+            self.span_cache.close()
+
+class TokenStage:
+    """Normalises whitespace and round-trips the text through the tokenizer (textCleaning.clean)."""
+    name = "tokens"
+    version = 1
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    @property
+    def fingerprint(self):
+        return json.dumps([self.name, self.version, self.processor.tokenizer.name])
+
+    def run(self, texts):
+        return [self.processor.clean(text) for text in texts]
+
+class Pipeline:
+    """
+    Runs documents through `stages` in order, reusing every output already
+    in `store` (a StageStore).
+
+    For each document the key of every stage is derived up front from the
+    raw text and the stage fingerprints (chain_key). Outputs are resolved
+    from the last stage backwards: documents whose final output is stored
+    cost one lookup, and a stage only runs on the documents it has no
+    output for, with identical inputs processed once.
+    """
+    def __init__(self, stages, store, metrics=None):
+        self.stages = list(stages)
+        self.store = store
+        self.metrics = metrics
+
+    def keys(self, texts):
+        """keys[i][j]: key of the output of stage i for document j."""
+        keys = []
+        previous = [content_hash(text) for text in texts]
+        for stage in self.stages:
+            fingerprint = stage.fingerprint
+            previous = [chain_key(fingerprint, key) for key in previous]
+            keys.append(previous)
+        return keys
+
+    def run(self, texts):
+        """Returns the output of the last stage for every text, in order."""
+        texts = ["" if not isinstance(text, str) else text for text in texts]
+        if not self.stages:
+            return texts
+        keys = self.keys(texts)
+        outputs = self._resolve(len(self.stages) - 1, texts, keys, range(len(texts)))
+        return [outputs[key] for key in keys[-1]]
+
+    def _resolve(self, level, texts, keys, documents):
+        """{key: output} of stage `level` for the given document positions."""
+        stage = self.stages[level]
+        wanted = {}
+        for j in documents:
+            wanted.setdefault(keys[level][j], j)
+        outputs = self.store.get_many(stage.name, wanted)
+        missing = [j for key, j in wanted.items() if key not in outputs]
+        if self.metrics is not None:
+            self.metrics.inc("stage_cache_hits_total", len(outputs), stage=stage.name)
+        if not missing:
+            return outputs
+
+        if level == 0:
+            inputs = [texts[j] for j in missing]
+        else:
+            previous = self._resolve(level - 1, texts, keys, missing)
+            inputs = [previous[keys[level - 1][j]] for j in missing]
+
+        print(f"Stage {stage.name}: processing {len(missing)} document(s), {len(outputs)} reused.")
+        start = time.perf_counter()
+        results = stage.run(inputs)
+        if self.metrics is not None:
+            self.metrics.observe("stage_seconds", time.perf_counter() - start, stage=stage.name)
+            self.metrics.inc("stage_documents_total", len(missing), stage=stage.name)
+        new_outputs = {keys[level][j]: output for j, output in zip(missing, results)}
+        self.store.put_many(stage.name, new_outputs.items())
+        outputs.update(new_outputs)
+        return outputs
+
+    def missing(self, texts, level=0):
+        """Positions of the texts with no stored output for stage `level`."""
+        texts = ["" if not isinstance(text, str) else text for text in texts]
+        keys = self.keys(texts)[level]
+        stored = self.store.get_many(self.stages[level].name, set(keys))
+        return [j for j, key in enumerate(keys) if key not in stored]
+
+    def prune(self, texts):
+        """Drops stored outputs that no stage needs for `texts` any more."""
+        texts = ["" if not isinstance(text, str) else text for text in texts]
+        return sum(self.store.prune(stage.name, set(stage_keys))
+                   for stage, stage_keys in zip(self.stages, self.keys(texts)))
+
+def load_phrase_model(processor, path, texts, mining_sample=99, remine=False):
+    """
+    The DisclaimerPhraseModel saved at `path`, so that the cleaning stage's
+    key stays stable as the corpus grows. It is fitted on the first
+    `mining_sample` documents and saved if there is none yet, or if
+    remine=True.
+    """
+    from clean.textCleaning import DisclaimerPhraseModel
+
+    if not remine and os.path.exists(path):
+        return DisclaimerPhraseModel.load(path)
+    print(f"Mining disclaimer phrases from {min(mining_sample, len(texts))} document(s)...")
+    phrase_model = processor.fit_phrase_model(texts[:mining_sample])
+    phrase_model.save(path)
+    return phrase_model
+
+def near_duplicate_sources(duplicates, articles, texts):
+    """
+    Adds the articles to `duplicates` (a NearDuplicateIndex, by URL, or by
+    content hash without a url column). Returns (duplicate_of, sources):
+    the original each article near-duplicates (or None), and the position
+    of the article whose outputs it reuses, itself unless its original is
+    among `articles`.
+    """
+    if "url" in articles.columns:
+        ids = articles["url"].astype(str).tolist()
+    else:
+        ids = [content_hash(text).hex() for text in texts]
+    duplicate_of = duplicates.add_many(zip(ids, texts))
+    first = {}
+    for j, doc_id in enumerate(ids):
+        first.setdefault(doc_id, j)
+    sources = [j if original is None else first.get(original, j) for j, original in enumerate(duplicate_of)]
+    return duplicate_of, sources
+
+def run_pipeline(articles_path, output_path, store_path="pipeline.db", scrape_pages=None, column="content",
+                 entities=True, spacy_model="en_core_web_sm", span_cache_path=None, num_workers=4,
+                 backend="processes", mining_sample=99, remine=False, refit=False, phrase_model_path=None,
+                 prune=False, dedupe=False, duplicate_threshold=0.8, duplicates_path=None, metrics=None):
+    """
+    Runs the pipeline over the articles stored at `articles_path` (any
+    articleSinks output) and writes them with a `<column>_clean` column to
+    `output_path` (.csv or .parquet).
+
+    With `scrape_pages=(start, end)` those listing pages are scraped into
+    articles_path first; the crawl state next to it means only new
+    articles are downloaded. entities=False skips NER masking (no spaCy
+    needed). prune=True drops stored outputs no current article uses.
+
+    The disclaimer phrases come from a DisclaimerPhraseModel saved at
+    `phrase_model_path` (default: next to the store, see load_phrase_model).
+    refit=True updates it with the articles it has not cleaned yet before
+    running; as the phrases change, every article is cleaned again.
+
+    dedupe=True keeps a NearDuplicateIndex at `duplicates_path` (default:
+    next to the store), also fed by the scraper. Articles whose estimated
+    similarity to an earlier one is at least `duplicate_threshold` (used
+    when the index is created) skip every stage and reuse that article's
+    output, and the output gets a duplicate_of column.
+    """
+    from clean.textCleaning import textCleaning
+
+    duplicates = None
+    if dedupe:
+        duplicates_path = duplicates_path or os.path.splitext(store_path)[0] + ".minhash.pkl"
+        duplicates = NearDuplicateIndex.open(duplicates_path, threshold=duplicate_threshold)
+
+    if scrape_pages is not None:
+        start_page, end_page = scrape_pages
+        sink = None if articles_path.endswith(".csv") else make_sink(articles_path)
+        scrape_and_append_to_csv(start_page=start_page, end_page=end_page, csv_filename=articles_path,
+                                 use_async=True, state_path=os.path.splitext(articles_path)[0] + ".crawlstate.db",
+                                 sink=sink, metrics=metrics, duplicates=duplicates)
+
+    articles = read_articles(articles_path)
+    texts = articles[column].where(articles[column].notna(), "").astype(str).tolist()
+    print(f"Loaded {len(texts)} article(s) from {articles_path}.")
+
+    sources = list(range(len(texts)))
+    if duplicates is not None:
+        duplicate_of, sources = near_duplicate_sources(duplicates, articles, texts)
+        duplicates.save(duplicates_path)
+        articles["duplicate_of"] = duplicate_of
+        reused = sum(source != j for j, source in enumerate(sources))
+        print(f"{reused} near-duplicate article(s) will reuse the output of an earlier one.")
+        if metrics is not None:
+            metrics.inc("stage_duplicates_skipped_total", reused)
+    positions = sorted(set(sources))
+    unique_texts = [texts[j] for j in positions]
+
+    processor = textCleaning(metrics=metrics)
+    with StageStore(store_path) as store:
+        phrase_model_path = phrase_model_path or os.path.splitext(store_path)[0] + ".phrases.pkl"
+        phrase_model = load_phrase_model(processor, phrase_model_path, texts, mining_sample, remine)
+        stages = [DisclaimerStage(processor, phrase_model, num_workers, backend)]
+        if entities:
+            stages.append(EntityStage(spacy_model, span_cache_path=span_cache_path, metrics=metrics))
+        stages.append(TokenStage(processor))
+
+        pipeline = Pipeline(stages, store, metrics)
+        started = time.monotonic()
+        try:
+            if refit and not remine:
+                new = pipeline.missing(unique_texts)
+                if new:
+                    print(f"Refitting the disclaimer phrases on {len(new)} new document(s)...")
+                    phrase_model.update([unique_texts[j] for j in new])
+                    phrase_model.save(phrase_model_path)
+            outputs = dict(zip(positions, pipeline.run(unique_texts)))
+            if prune:
+                print(f"Pruned {pipeline.prune(unique_texts)} stale output(s) from {store_path}.")
+        finally:
+            for stage in stages:
+                if hasattr(stage, "close"):
+                    stage.close()
+        print(f"Pipeline finished in {time.monotonic() - started:.1f}s.")
+
+    articles[f"{column}_clean"] = [outputs[source] for source in sources]
+    if output_path.endswith(".csv"):
+        articles.to_csv(output_path, index=False, encoding="utf-8")
+    else:
+        articles.to_parquet(output_path, index=False)
+    print(f"Saved {len(articles)} article(s) to {output_path}.")
+    return articles
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", default="morningstar_equity_research2.csv",
+                        help="scraped articles: .csv, or a .parquet / .arrow sink directory")
+    parser.add_argument("--output", default="articles_clean.parquet", help=".parquet or .csv")
+    parser.add_argument("--store", default="pipeline.db", help="SQLite file with the per-stage outputs")
+    parser.add_argument("--scrape", nargs=2, type=int, metavar=("START", "END"),
+                        help="scrape these listing pages into --articles first")
+    parser.add_argument("--column", default="content")
+    parser.add_argument("--no-entities", action="store_true", help="skip NER masking")
+    parser.add_argument("--spacy-model", default="en_core_web_sm")
+    parser.add_argument("--span-cache", default=None, help="SQLite file caching entity spans between runs")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backend", choices=("processes", "threads", "inline"), default="processes")
+    parser.add_argument("--mining-sample", type=int, default=99)
+    parser.add_argument("--phrase-model", default=None, help="fitted disclaimer phrases (default: next to --store)")
+    parser.add_argument("--remine", action="store_true", help="mine the disclaimer phrases again")
+    parser.add_argument("--refit", action="store_true", help="update the disclaimer phrases with the new articles")
+    parser.add_argument("--prune", action="store_true", help="drop stored outputs no current article uses")
+    parser.add_argument("--dedupe", action="store_true", help="reuse the output of near-duplicate articles")
+    parser.add_argument("--duplicate-threshold", type=float, default=0.8)
+    parser.add_argument("--metrics", default=None, help="write run metrics here (.json, or .prom for Prometheus)")
+    args = parser.parse_args()
+
+    metrics = PipelineMetrics() if args.metrics else None
+    run_pipeline(args.articles, args.output, args.store, scrape_pages=args.scrape, column=args.column,
+                 entities=not args.no_entities, spacy_model=args.spacy_model, span_cache_path=args.span_cache,
+                 num_workers=args.workers, backend=args.backend, mining_sample=args.mining_sample,
+                 remine=args.remine, refit=args.refit, phrase_model_path=args.phrase_model, prune=args.prune,
+                 dedupe=args.dedupe, duplicate_threshold=args.duplicate_threshold, metrics=metrics)
+    if metrics is not None:
+        write_metrics(metrics, args.metrics)
+        print(metrics.summary())
+
+if __name__ == "__main__":
+    main()
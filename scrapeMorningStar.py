@@ -1,52 +1,132 @@
+import asyncio
+import contextlib
+import random
 import time
-import os
+from collections import deque
+from urllib.parse import urldefrag, urlencode, urljoin, urlsplit
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-
-def scrape_equity_research_insights_page(page_number=1):
+from bs4 import BeautifulSoup, SoupStrainer
+from articleSinks import CsvSink
+from crawlState import CrawlState
+
+LISTING_URL = (
+    "https://www.morningstar.co.uk/uk/collection/2110/2310/"
+    "equity-research--insights.aspx"
+)
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/108.0.0.0 Safari/537.36"
+    )
+}
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# HTML extraction backends:
+#   "html.parser" - full BeautifulSoup tree (reference behaviour)
+#   "strainer"    - html.parser restricted to the rows / paragraphs we read; same output
+#   "lxml"        - walks an lxml tree directly, several times faster. Same output on
+#                   well-formed pages, but malformed markup is repaired the way browsers do:
+#                     - an unclosed <p> ends at the next <p>, <div> or <table>, where
+#                       html.parser nests them, so its outer paragraph repeats the inner text
+#                     - an unclosed <td> ends at the next <td>, likewise
+#                     - <![CDATA[...]]> sections are dropped, html.parser keeps their text
+#                   Check a cached crawl with compare_parser_backends before switching.
+PARSERS = ("html.parser", "strainer", "lxml")
+
+_LXML_TEXT = None
+
+def listing_page_url(page_number):
+    """Full URL of one listing page, e.g. ...insights.aspx?page=2"""
+    return f"{LISTING_URL}?{urlencode({'page': page_number})}"
+
+def article_key(article_url):
     """
-    Scrapes article listings (e.g., title, URL, author, date) from a single
-    page of Morningstar’s 'Equity Research & Insights' listing.
+    Normalised form of an article URL (absolute, without fragment), used to
+    recognise articles that have already been stored.
+    """
+    return urldefrag(urljoin(LISTING_URL, article_url))[0]
+
+def make_soup(html, parser, only_tag):
+    """Builds the BeautifulSoup tree for `parser`, keeping only `only_tag` elements when straining."""
+    if parser == "html.parser":
+        return BeautifulSoup(html, "html.parser")
+    if parser == "strainer":
+        # <template> is kept so that its contents stay inert, as in the full tree
+        return BeautifulSoup(html, "html.parser", parse_only=SoupStrainer([only_tag, "template"]))
+    raise ValueError(f"Unknown parser backend {parser!r}; expected one of {PARSERS}")
+
+def lxml_document(html):
+    """Parses `html` with lxml, or returns None for an empty document."""
+    import lxml.html
+    from lxml import etree
+
+    if not html.strip():
+        return None
+    # Parse bytes so pages with an XML encoding declaration are accepted
+    utf8_parser = lxml.html.HTMLParser(encoding="utf-8")
+    try:
+        return lxml.html.document_fromstring(html.encode("utf-8"), parser=utf8_parser)
+    except etree.ParserError:
+        return None
 
-    Returns:
-        A list of dicts, each containing metadata about an article:
-        [
-          {
-            "title": <str>,
-            "url": <str>,
-            "collection": <str>,
-            "author": <str>,
-            "date": <str>
-          },
-          ...
-        ]
+def lxml_text(element):
     """
+    lxml equivalent of BeautifulSoup's get_text(strip=True): every text node
+    stripped and concatenated, skipping comments and script/style contents.
+    """
+    global _LXML_TEXT
+    if _LXML_TEXT is None:
+        from lxml import etree
+        _LXML_TEXT = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+    return "".join(text.strip() for text in _LXML_TEXT(element))
+
+def parse_listing_html_lxml(html):
+    """lxml backend of parse_listing_html."""
+    root = lxml_document(html)
+    if root is None:
+        return []
 
-    base_url = (
-        "https://www.morningstar.co.uk/uk/collection/2110/2310/"
-        "equity-research--insights.aspx"
-    )
+    articles_data = []
+    for row in root.iter("tr"):
+        columns = list(row.iter("td"))
+        if len(columns) < 4:
+            continue
 
-    params = {"page": page_number}  # e.g. ?page=2
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/108.0.0.0 Safari/537.36"
-        )
-    }
+        link_tag = next((a for a in columns[0].iter("a") if a.get("href") is not None), None)
+        if link_tag is None:
+            continue
 
-    # time.sleep(1) # optional: polite delay if scraping many pages quickly
+        articles_data.append({
+            "title": lxml_text(link_tag),
+            "url": link_tag.get("href"),
+            "collection": lxml_text(columns[1]),
+            "author": lxml_text(columns[2]),
+            "date": lxml_text(columns[3])
+        })
 
-    try:
-        response = requests.get(base_url, headers=headers, params=params)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] Unable to fetch page {page_number}: {e}")
-        return []
+    return articles_data
 
-    soup = BeautifulSoup(response.text, "html.parser")
+def parse_article_html_lxml(html):
+    """lxml backend of parse_article_html."""
+    root = lxml_document(html)
+    if root is None:
+        return ""
+    paragraphs = (lxml_text(p) for p in root.iter("p"))
+    return "\n\n".join(text for text in paragraphs if text)
+
+def parse_listing_html(html, parser="html.parser"):
+    """
+    Extracts article metadata (title, url, collection, author, date) from
+    the HTML of a listing page. See scrape_equity_research_insights_page.
+    `parser` is one of PARSERS.
+    """
+    if parser == "lxml":
+        return parse_listing_html_lxml(html)
+    soup = make_soup(html, parser, "tr")
 
     # The articles appear in table-like rows; adjust if needed
     table_rows = soup.find_all("tr")
@@ -83,44 +163,323 @@ def scrape_equity_research_insights_page(page_number=1):
 
     return articles_data
 
-def scrape_article_content(article_url):
+def parse_article_html(html, parser="html.parser"):
+    """
+    Extracts the main text content of an article page as a single string,
+    joining the non-empty <p> paragraphs with blank lines. `parser` is one
+    of PARSERS.
+    """
+    if parser == "lxml":
+        return parse_article_html_lxml(html)
+    soup = make_soup(html, parser, "p")
+
+    # Grab paragraphs from the main content area
+    paragraphs = soup.find_all("p")
+    article_text_list = []
+    for p in paragraphs:
+        text = p.get_text(strip=True)
+        if text:
+            article_text_list.append(text)
+
+    full_text = "\n\n".join(article_text_list)
+    return full_text
+
+def compare_parser_backends(cache, parser, reference="html.parser"):
+    """
+    Re-parses every page stored in a ResponseCache with `parser` and with
+    `reference`, and returns the URLs whose extracted data differ. Run this
+    over a cached crawl before switching backends.
+    """
+    mismatches = []
+    for url_class, parse in (("listing", parse_listing_html), ("article", parse_article_html)):
+        for url in cache.urls(url_class):
+            html = cache.read(cache.lookup(url))
+            if html is not None and parse(html, parser) != parse(html, reference):
+                mismatches.append(url)
+    return mismatches
+
+def fetch_html(url, url_class, session=None, cache=None, metrics=None):
+    """
+    Fetches `url` and returns its body text, going through `cache` (a
+    ResponseCache) when one is given: fresh entries are served from disk,
+    stale ones are revalidated with a conditional request, and new bodies
+    are stored. Raises requests.exceptions.RequestException on failure,
+    including a cache miss while the cache is offline.
+
+    `metrics` (a PipelineMetrics) records cache hits, request latency,
+    response status codes and body sizes per url_class.
+    """
+    http = session or requests
+    headers = HEADERS
+    entry = cache.lookup(url) if cache is not None else None
+    cached = cache.read(entry) if entry is not None else None
+    if cached is not None:
+        if cache.offline or cache.is_fresh(entry):
+            if metrics is not None:
+                metrics.inc("cache_hits_total", url_class=url_class)
+            return cached
+        headers = dict(HEADERS, **cache.conditional_headers(entry))
+    elif cache is not None and cache.offline:
+        raise requests.exceptions.ConnectionError(f"{url} is not cached and the cache is offline")
+
+    start = time.perf_counter()
+    response = http.get(url, headers=headers)
+    if metrics is not None:
+        metrics.observe("http_request_seconds", time.perf_counter() - start, url_class=url_class)
+        metrics.inc("http_responses_total", status=response.status_code, url_class=url_class)
+        metrics.inc("response_bytes_total", len(response.content), url_class=url_class)
+    if cached is not None and response.status_code == 304:
+        cache.touch(url)
+        return cached
+    response.raise_for_status()
+
+    if cache is not None:
+        cache.store(url, url_class, response.text,
+                    response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return response.text
+
+def scrape_equity_research_insights_page(page_number=1, session=None, cache=None, parser="html.parser",
+                                         metrics=None):
+    """
+    Scrapes article listings (e.g., title, URL, author, date) from a single
+    page of Morningstar’s 'Equity Research & Insights' listing.
+
+    Pass a requests.Session as `session` to reuse keep-alive connections
+    across calls, and a ResponseCache as `cache` to cache the listing HTML
+    (see fetch_html). `parser` selects the extraction backend (PARSERS).
+    `metrics` is an optional PipelineMetrics (see fetch_html and timed_parse).
+
+    Returns:
+        A list of dicts, each containing metadata about an article:
+        [
+          {
+            "title": <str>,
+            "url": <str>,
+            "collection": <str>,
+            "author": <str>,
+            "date": <str>
+          },
+          ...
+        ]
+    """
+    # time.sleep(1) # optional: polite delay if scraping many pages quickly
+
+    try:
+        html = fetch_html(listing_page_url(page_number), "listing", session, cache, metrics)
+    except requests.exceptions.RequestException as e:
+        print(f"[ERROR] Unable to fetch page {page_number}: {e}")
+        return []
+
+    return timed_parse(parse_listing_html, html, parser, metrics, "listing")
+
+def scrape_article_content(article_url, session=None, cache=None, parser="html.parser", metrics=None):
     """
     Given a specific article URL, fetches and returns the main text content
     as a single string (or blank if there's an error).
 
-    Adjust the selectors, e.g. searching for main content in <p> tags.
+    Relative URLs from the listing are resolved against the listing page.
+    Adjust the selectors in parse_article_html, e.g. searching for main
+    content in <p> tags.
     """
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/108.0.0.0 Safari/537.36"
-        )
-    }
+    content = fetch_article_content(article_url, session, cache, parser, metrics)
+    return content if content is not None else ""
 
+def fetch_article_content(article_url, session=None, cache=None, parser="html.parser", metrics=None):
+    """
+    scrape_article_content, but returns None when the article could not be
+    fetched, so a failed fetch can be told apart from an article without text.
+    """
     # time.sleep(1)  # optional: polite delay
 
     try:
-        response = requests.get(article_url, headers=headers)
-        response.raise_for_status()
+        html = fetch_html(urljoin(LISTING_URL, article_url), "article", session, cache, metrics)
     except requests.exceptions.RequestException as e:
         print(f"[ERROR] Unable to fetch article URL ({article_url}): {e}")
-        return ""
+        return None
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    return timed_parse(parse_article_html, html, parser, metrics, "article")
 
-    # Grab paragraphs from the main content area
-    paragraphs = soup.find_all("p")
-    article_text_list = []
-    for p in paragraphs:
-        text = p.get_text(strip=True)
-        if text:
-            article_text_list.append(text)
+def timed_parse(parse, html, parser, metrics=None, url_class=None):
+    """parse(html, parser), timed into metrics' parse_seconds histogram when one is given."""
+    if metrics is None:
+        return parse(html, parser)
+    with metrics.timer("parse_seconds", url_class=url_class, parser=parser):
+        return parse(html, parser)
 
-    full_text = "\n\n".join(article_text_list)
-    return full_text
+class HostRateLimiter:
+    """
+    Spaces out request start times so that no host receives more than
+    `requests_per_second` requests per second. A falsy rate disables limiting.
+    """
+    def __init__(self, requests_per_second=None):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_slot = {}
+
+    async def wait(self, host):
+        if not self.min_interval:
+            return
+        # Reserving the slot is synchronous, so no lock is needed on the event loop
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+async def fetch_text_async(session, url, url_class=None, cache=None, semaphore=None, limiter=None,
+                           max_retries=3, backoff=1.0, metrics=None):
+    """
+    Fetches `url` with a shared aiohttp session and returns the body text,
+    or None if the request failed. `cache` is used as in fetch_html.
 
-def scrape_and_append_to_csv(start_page=3, end_page=500, csv_filename="morningstar_equity_research.csv"):
+    Connection errors, timeouts and RETRY_STATUSES responses are retried up
+    to `max_retries` times with jittered exponential backoff (honouring
+    Retry-After when the server sends one). Other HTTP errors fail at once.
+    `metrics` records the same as in fetch_html, plus retries and failures.
+
+    `semaphore` bounds the requests in flight (no bound if None). The
+    `limiter` slot is taken only once the semaphore is held, so requests
+    that waited for a connection do not all start together when one frees.
+    """
+    import aiohttp
+
+    headers = None
+    entry = cache.lookup(url) if cache is not None else None
+    cached = cache.read(entry) if entry is not None else None
+    if cached is not None:
+        if cache.offline or cache.is_fresh(entry):
+            if metrics is not None:
+                metrics.inc("cache_hits_total", url_class=url_class)
+            return cached
+        headers = cache.conditional_headers(entry)
+    elif cache is not None and cache.offline:
+        print(f"[ERROR] {url} is not cached and the cache is offline")
+        return None
+
+    host = urlsplit(url).netloc
+    semaphore = semaphore if semaphore is not None else contextlib.nullcontext()
+    for attempt in range(max_retries + 1):
+        delay = backoff * (2 ** attempt) * (1 + random.random() / 2)
+        try:
+            async with semaphore:
+                if limiter is not None:
+                    await limiter.wait(host)
+                start = time.perf_counter()
+                async with session.get(url, headers=headers) as response:
+                    if metrics is not None:
+                        metrics.inc("http_responses_total", status=response.status, url_class=url_class)
+                    if cached is not None and response.status == 304:
+                        cache.touch(url)
+                        return cached
+                    if response.status not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        text = await response.text()
+                        if metrics is not None:
+                            metrics.observe("http_request_seconds", time.perf_counter() - start, url_class=url_class)
+                            metrics.inc("response_bytes_total", len(text.encode("utf-8")), url_class=url_class)
+                        if cache is not None:
+                            cache.store(url, url_class, text,
+                                        response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                        return text
+                    error = f"HTTP {response.status}"
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+        except aiohttp.ClientResponseError as e:
+            print(f"[ERROR] Unable to fetch {url}: {e}")
+            if metrics is not None:
+                metrics.inc("http_failures_total", url_class=url_class)
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = repr(e)
+            if metrics is not None:
+                metrics.inc("http_errors_total", error=type(e).__name__, url_class=url_class)
+
+        if attempt == max_retries:
+            print(f"[ERROR] Giving up on {url} after {attempt + 1} attempt(s): {error}")
+            if metrics is not None:
+                metrics.inc("http_failures_total", url_class=url_class)
+            return None
+        if metrics is not None:
+            metrics.inc("http_retries_total", url_class=url_class)
+        await asyncio.sleep(delay)
+
+async def scrape_page_async(session, page_number, semaphore, limiter=None, max_retries=3,
+                            select_articles=None, cache=None, parser="html.parser", metrics=None):
+    """
+    Async counterpart of scrape_equity_research_insights_page followed by
+    scrape_article_content for every article: the listing is fetched first,
+    then all of its articles concurrently. Returns the list of article dicts
+    in listing order.
+
+    If `select_articles` is given, it is called with the listing's articles
+    and only the ones it returns get their content fetched; the others are
+    returned without a "content" key. An article whose fetch failed gets
+    None as its content. `cache` is an optional ResponseCache,
+    `parser` one of PARSERS and `metrics` an optional PipelineMetrics.
+    """
+    html = await fetch_text_async(session, listing_page_url(page_number), "listing", cache,
+                                  semaphore=semaphore, limiter=limiter, max_retries=max_retries,
+                                  metrics=metrics)
+    if html is None:
+        return []
+    page_articles = timed_parse(parse_listing_html, html, parser, metrics, "listing")
+    to_fetch = select_articles(page_articles) if select_articles else page_articles
+
+    contents = await asyncio.gather(*(
+        fetch_text_async(session, urljoin(LISTING_URL, article.get("url", "")), "article", cache,
+                         semaphore=semaphore, limiter=limiter, max_retries=max_retries, metrics=metrics)
+        for article in to_fetch
+    ))
+    for article, article_html in zip(to_fetch, contents):
+        article["content"] = (timed_parse(parse_article_html, article_html, parser, metrics, "article")
+                              if article_html is not None else None)
+    return page_articles
+
+async def scrape_pages_async(pages, concurrency=16, requests_per_second=8.0, max_retries=3,
+                             pages_in_flight=None, select_articles=None, cache=None,
+                             parser="html.parser", metrics=None):
+    """
+    Async generator yielding (page_number, page_articles) for every page in
+    `pages`, strictly in the given order.
+
+    All requests go through one aiohttp session whose keep-alive pool holds
+    at most `concurrency` connections. Up to `pages_in_flight` pages (default
+    concurrency // 4, at least 2) are scraped ahead of the page currently
+    being yielded, which bounds memory on long backfills. `select_articles`,
+    `cache`, `parser` and `metrics` are passed on to scrape_page_async.
+    """
+    import aiohttp
+
+    pages_in_flight = pages_in_flight or max(2, concurrency // 4)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = HostRateLimiter(requests_per_second)
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(connector=connector, headers=HEADERS, timeout=timeout) as session:
+        pending = deque()
+        try:
+            for page_num in pages:
+                task = asyncio.ensure_future(
+                    scrape_page_async(session, page_num, semaphore, limiter, max_retries,
+                                      select_articles, cache, parser, metrics)
+                )
+                pending.append((page_num, task))
+                if len(pending) >= pages_in_flight:
+                    num, task = pending.popleft()
+                    yield num, await task
+            while pending:
+                num, task = pending.popleft()
+                yield num, await task
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+def scrape_and_append_to_csv(start_page=3, end_page=500, csv_filename="morningstar_equity_research.csv",
+                             use_async=False, concurrency=16, requests_per_second=8.0, max_retries=3,
+                             state_path=None, skip_finished_pages=True, cache=None,
+                             parser="html.parser", sink=None, metrics=None, duplicates=None,
+                             max_article_attempts=3):
     """
     Scrapes pages from start_page to end_page. For each page:
       1) Collect article metadata
@@ -129,51 +488,168 @@ def scrape_and_append_to_csv(start_page=3, end_page=500, csv_filename="morningst
       4) Append the DataFrame to CSV in 'a' (append) mode
 
     This way, you don't keep all data in memory, and you can resume if needed.
-    """
-
-    # Check if CSV already exists to determine whether to write headers or not
-    file_already_exists = os.path.isfile(csv_filename)
-
-    for page_num in range(start_page, end_page + 1):
-        print(f"Scraping listing on page {page_num}...")
-        page_articles = scrape_equity_research_insights_page(page_num)
 
-        # For each article found, fetch the content
-        for article in page_articles:
-            article_url = article.get("url", "")
-            print(f"  Fetching article content: {article_url} ...")
-            content = scrape_article_content(article_url)
-            article["content"] = content
-
-        # Convert the page's articles to a DataFrame
-        df_page = pd.DataFrame(page_articles)
-
-        # If there are no articles or if the page failed, skip CSV writing
-        if df_page.empty:
+    `sink` replaces the CSV with another output from articleSinks (e.g.
+    make_sink("articles.parquet")); it is closed when the crawl ends.
+
+    With use_async=True, listing pages and article bodies are fetched
+    concurrently (see scrape_pages_async) over a pool of at most
+    `concurrency` keep-alive connections, limited to `requests_per_second`
+    per host and retried up to `max_retries` times with backoff. Pages are
+    still appended to the CSV in page order.
+
+    If `state_path` is given, a CrawlState at that path records finished
+    pages and stored article URLs. Articles already stored (by URL) are
+    neither fetched nor appended again, and pages finished by an earlier
+    run are skipped unless skip_finished_pages=False (use that when the
+    listing has shifted and old pages may hold new articles). On first use
+    against an existing output, the state is seeded with the output's URLs.
+    Pages count as stored only once the sink has committed them to disk.
+    Articles whose fetch failed are left out of the output and recorded as
+    failed, and their page is not finished, so the next run retries them.
+    After `max_article_attempts` failed runs an article is given up on and
+    its page can finish.
+
+    `cache` is an optional ResponseCache used for every listing and article
+    request; with an offline cache the run re-parses stored HTML without
+    touching the network. `parser` selects the HTML extraction backend (one
+    of PARSERS).
+
+    `metrics` is an optional PipelineMetrics (pipelineMetrics.py). It
+    receives per-request latency, status codes, bytes, retries and cache
+    hits, parse and sink write times, and page / article counts.
+
+    `duplicates` is an optional NearDuplicateIndex (nearDuplicates.py).
+    Every new article's content is added to it under its URL, and the
+    article gets a `duplicate_of` column holding the URL of the earlier
+    near-identical article (empty for originals). The index is updated in
+    memory; save it when the crawl ends.
+    """
+    sink = sink if sink is not None else CsvSink(csv_filename)
+    pages = range(start_page, end_page + 1)
+
+    state = CrawlState(state_path, max_article_attempts) if state_path else None
+    if state is not None:
+        if state.is_empty():
+            state.seed_articles(article_key(url) for url in sink.existing_urls())
+        if skip_finished_pages:
+            finished = state.finished_pages(pages)
+            if finished:
+                print(f"Skipping {len(finished)} page(s) finished by an earlier run.")
+            pages = [page_num for page_num in pages if page_num not in finished]
+
+    # Pages handed to the sink but not yet committed: page -> (article keys, finished, failed keys)
+    uncommitted = {}
+    # Keys of the articles in uncommitted, which the crawl state does not know yet
+    pending = set()
+
+    def select_new_articles(page_articles):
+        """Drops articles already stored or waiting in the sink, and repeats within the page."""
+        if state is None:
+            return page_articles
+        keys = [article_key(article.get("url", "")) for article in page_articles]
+        known = state.known_articles(keys) | pending.intersection(keys)
+        fresh = []
+        for article, key in zip(page_articles, keys):
+            if key not in known:
+                known.add(key)
+                fresh.append(article)
+        return fresh
+
+    def record_committed(page_numbers):
+        for page_num in page_numbers:
+            keys, finished, failed_keys = uncommitted.pop(page_num)
+            if state is not None:
+                given_up = state.record_page(page_num, keys, finished, failed_keys)
+                if given_up:
+                    print(f"[ERROR] Giving up on {len(given_up)} article(s) from page {page_num} "
+                          f"after {state.max_attempts} failed attempts: {', '.join(sorted(given_up))}")
+            pending.difference_update(keys)
+
+    def write_page(page_num, page_articles):
+        listed = len(page_articles)
+        page_articles = select_new_articles(page_articles)
+        failed = [article for article in page_articles if article.get("content", "") is None]
+        if failed and state is not None:
+            # Held back rather than stored blank, so the next run fetches them again
+            page_articles = [article for article in page_articles if article.get("content", "") is not None]
+            print(f"  {len(failed)} article(s) on page {page_num} could not be fetched; "
+                  f"they will be retried on a later run.")
+        else:
+            for article in failed:
+                article["content"] = ""
+        if duplicates is not None:
+            for article in page_articles:
+                article["duplicate_of"] = duplicates.add(article.get("url", ""), article.get("content", ""))
+                if metrics is not None and article["duplicate_of"] is not None:
+                    metrics.inc("near_duplicates_total")
+        if not listed:
             print(f"  No articles found on page {page_num}.")
-            continue
+        elif not page_articles and not failed:
+            print(f"  All {listed} article(s) on page {page_num} were already stored.")
+        else:
+            print(f"  Appended {len(page_articles)} article(s) from page {page_num} to {sink.path}.\n")
+
+        # An empty listing may be a failed fetch, so only non-empty pages count as finished
+        keys = [article_key(article.get("url", "")) for article in page_articles]
+        uncommitted[page_num] = (keys, listed > 0, [article_key(article.get("url", "")) for article in failed])
+        pending.update(keys)
+        if metrics is None:
+            record_committed(sink.write(page_num, page_articles))
+            return
+        metrics.inc("pages_total")
+        if not listed:
+            metrics.inc("empty_pages_total")
+        metrics.inc("articles_listed_total", listed)
+        metrics.inc("articles_written_total", len(page_articles))
+        if failed:
+            metrics.inc("articles_failed_total", len(failed))
+        with metrics.timer("sink_write_seconds"):
+            record_committed(sink.write(page_num, page_articles))
 
-        # Append to CSV. Only include header if file does not already exist
-        df_page.to_csv(
-            csv_filename,
-            mode='a',               # append mode
-            index=False,
-            encoding='utf-8',
-            header=not file_already_exists
-        )
-
-        # After the first write, the file definitely has data
-        file_already_exists = True
-
-        print(f"  Appended {len(df_page)} article(s) from page {page_num} to {csv_filename}.\n")
+    try:
+        if use_async:
+            async def crawl():
+                print(f"Scraping {len(pages)} page(s) with {concurrency} concurrent connection(s)...")
+                async for page_num, page_articles in scrape_pages_async(
+                    pages, concurrency=concurrency, requests_per_second=requests_per_second,
+                    max_retries=max_retries, select_articles=select_new_articles, cache=cache,
+                    parser=parser, metrics=metrics
+                ):
+                    write_page(page_num, page_articles)
+
+            asyncio.run(crawl())
+            return
+
+        # One session keeps connections alive between the listing and article requests
+        with requests.Session() as session:
+            for page_num in pages:
+                print(f"Scraping listing on page {page_num}...")
+                page_articles = scrape_equity_research_insights_page(page_num, session=session, cache=cache,
+                                                                     parser=parser, metrics=metrics)
+
+                # For each new article found, fetch the content
+                for article in select_new_articles(page_articles):
+                    article_url = article.get("url", "")
+                    print(f"  Fetching article content: {article_url} ...")
+                    article["content"] = fetch_article_content(article_url, session=session, cache=cache,
+                                                               parser=parser, metrics=metrics)
+
+                write_page(page_num, page_articles)
+    finally:
+        record_committed(sink.close())
+        if state is not None:
+            state.close()
 
 def main():
-    # Example usage: scrape pages 3 to 10 incrementally
+    # Example usage: scrape pages 200 to 300 concurrently
     scrape_and_append_to_csv(
         start_page=200,
         end_page=300,
-        csv_filename="morningstar_equity_research2.csv"
+        csv_filename="morningstar_equity_research2.csv",
+        use_async=True,
+        state_path="morningstar_equity_research2.crawlstate.db"
     )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,82 @@
+import http.server
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "clean"), os.path.join(ROOT, "portfolioConstruction")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+LISTING_PATH = "/uk/collection/2110/2310/equity-research--insights.aspx"
+
+def listing_page(articles):
+    """Listing HTML with one row per (article path, title)."""
+    rows = "".join(
+        f"<tr><td><a href='{path}'>{title}</a></td><td>Stock Analysis</td><td>Analyst</td><td>01/02/2024</td></tr>"
+        for path, title in articles
+    )
+    return f"<html><body><table><tbody>{rows}</tbody></table></body></html>"
+
+def article_page(text):
+    return f"<html><body><article><p>{text}</p></article></body></html>"
+
+class LocalSite:
+    """
+    Local stand-in for the Morningstar site. `routes` maps a path (listing
+    pages as f"{LISTING_PATH}?page=N") to a body, or to a callable returning
+    (status, body). Every request is logged as (monotonic time, path).
+    """
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        site = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                site.requests.append((time.monotonic(), self.path))
+                route = site.routes.get(self.path)
+                if route is None:
+                    route = site.routes.get(urlsplit(self.path).path)
+                status, body = (404, "") if route is None else (route() if callable(route) else (200, route))
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def add_listing(self, page_number, articles):
+        self.routes[f"{LISTING_PATH}?page={page_number}"] = listing_page(articles)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def site(monkeypatch):
+    import scrapeMorningStar
+
+    local = LocalSite()
+    monkeypatch.setattr(scrapeMorningStar, "LISTING_URL", local.base_url + LISTING_PATH)
+    yield local
+    local.close()
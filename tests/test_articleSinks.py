@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from articleSinks import make_sink, read_articles
+
+def article(name, date):
+    return {"title": name.title(), "url": f"/{name}", "collection": "Stock Analysis", "author": "Ann",
+            "date": date, "content": name}
+
+@pytest.mark.parametrize("extension", ["parquet", "arrow"])
+def test_unparseable_dates_are_stored_as_null(tmp_path, extension):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"articles.{extension}")
+    with make_sink(path) as sink:
+        sink.write(1, [article("a", "01/02/2024"), article("b", ""), article("c", None), article("d", "soon")])
+
+    rows = read_articles(path)
+    assert list(rows["url"]) == ["/a", "/b", "/c", "/d"]
+    assert rows["date"][0] == pd.Timestamp("2024-02-01")
+    assert rows["date"][1:].isna().all()
+    assert list(rows["date_text"][1:].fillna("?")) == ["", "?", "soon"]
+
+def test_csv_sink_treats_empty_file_as_new(tmp_path):
+    path = tmp_path / "articles.csv"
+    path.write_text("")
+    with make_sink(str(path)) as sink:
+        assert sink.existing_urls() == []
+        sink.write(1, [article("a", "01/02/2024")])
+
+    rows = read_articles(str(path))
+    assert list(rows["url"]) == ["/a"]
+    assert list(rows.columns) == ["title", "url", "collection", "author", "date", "content"]
@@ -0,0 +1,81 @@
+import threading
+
+import pandas as pd
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+import cleanNER
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns([{"label": "ORG", "pattern": "Acme"}, {"label": "PERSON", "pattern": "Jane"}])
+    path = tmp_path_factory.mktemp("model") / "ruler"
+    nlp.to_disk(path)
+    return str(path)
+
+@pytest.fixture
+def transcripts(tmp_path):
+    path = tmp_path / "transcripts.csv"
+    pd.DataFrame({"id": range(40), "transcript": [f"Jane from Acme, call {i}" for i in range(40)]}).to_csv(
+        path, index=False)
+    return str(path)
+
+def run_with_timeout(target, timeout=60):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = target()
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "stream_mask_file hung"
+    return outcome
+
+def test_stream_mask_file(model_path, transcripts, tmp_path):
+    output = str(tmp_path / "masked.csv")
+    done = cleanNER.stream_mask_file(transcripts, output, batch_rows=4, num_workers=2, max_pending=2,
+                                     model=model_path)
+    assert done == 40
+    masked = pd.read_csv(output)
+    assert list(masked["id"]) == list(range(40))
+    assert masked["transcript"][7] == "[PERSON] from [ORG], call 7"
+
+def test_stream_mask_file_writer_error_does_not_hang(model_path, transcripts, tmp_path, monkeypatch):
+    writes = []
+
+    def failing_write(self, batch):
+        writes.append(len(batch))
+        if len(writes) == 2:
+            raise OSError("disk full")
+
+    monkeypatch.setattr(cleanNER.MaskedOutputWriter, "write", failing_write)
+    outcome = run_with_timeout(lambda: cleanNER.stream_mask_file(
+        transcripts, str(tmp_path / "masked.parquet"), batch_rows=4, num_workers=2, max_pending=2,
+        model=model_path))
+    assert isinstance(outcome.get("error"), OSError)
+    assert writes == [4, 4]
+
+@pytest.mark.parametrize("input_name", ["notes.csv", "notes.pkl"])
+def test_stream_mask_file_column_missing_in_first_batch(model_path, tmp_path, input_name):
+    pytest.importorskip("pyarrow")
+    frame = pd.DataFrame({"transcript": [f"Jane at Acme {i}" for i in range(8)],
+                          "note": [None] * 4 + ["x", "y", None, "z"]})
+    input_path = str(tmp_path / input_name)
+    if input_name.endswith(".csv"):
+        frame.to_csv(input_path, index=False)
+    else:
+        frame.to_pickle(input_path)
+    output = str(tmp_path / "masked.parquet")
+
+    assert cleanNER.stream_mask_file(input_path, output, batch_rows=4, num_workers=1, model=model_path) == 8
+    masked = pd.read_parquet(output)
+    assert list(masked["note"].iloc[4:].fillna("-")) == ["x", "y", "-", "z"]
+    assert masked["note"].iloc[:4].isna().all()
+    assert masked["transcript"][0] == "[PERSON] at [ORG] 0"
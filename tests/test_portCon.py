@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portCon import Optimizer, ewm_mean
+
+def test_ewm_mean_matches_pandas_bit_for_bit():
+    rng = np.random.default_rng(3)
+    values = rng.normal(size=(200, 12))
+    values[rng.random(values.shape) < 0.2] = np.nan  # gaps
+    values[:30, 0] = np.nan                           # late start
+    values[:, 1] = np.nan                             # never observed
+    values[50:, 2] = 0.25                             # constant stretch
+    halflives = [1, 2.5, 10, 63]
+    alphas = [1 - np.exp(np.log(0.5) / halflife) for halflife in halflives] + [0.5]
+
+    smoothed = ewm_mean(values, alphas)
+    for alpha, result in zip(alphas, smoothed):
+        expected = pd.DataFrame(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+        np.testing.assert_array_equal(result, expected)
+
+def test_smooth_alpha_cache_matches_column_loop():
+    rng = np.random.default_rng(4)
+    frame = pd.DataFrame(rng.normal(size=(80, 5)), columns=list("abcde"))
+    frame.iloc[rng.random(frame.shape) < 0.1] = np.nan
+    alpha = 1 - np.exp(np.log(0.5) / 5)
+    expected = frame.copy()
+    for column in expected.columns:
+        expected[column] = expected[column].ewm(alpha=alpha, adjust=False).mean()
+    pd.testing.assert_frame_equal(Optimizer(solver="diagonal").smooth_alpha_cache(frame, 5), expected)
+
+def diagonal_weights(alpha, variances, risk_budget, gme_limit):
+    optimizer = Optimizer(risk_budget=risk_budget, gme_limit=gme_limit, solver="diagonal")
+    return optimizer.solve_long_short_diagonal(alpha, variances)
+
+def assert_feasible(x, variances, risk_budget, gme_limit):
+    assert abs(x.sum()) <= 1e-9
+    assert np.dot(variances, x * x) <= risk_budget ** 2 * (1 + 1e-9)
+    assert np.abs(x).sum() <= gme_limit * (1 + 1e-9)
+    assert np.abs(x).max() <= 1 + 1e-12
+
+def lp_optimum(alpha, gme_limit):
+    """max alpha' x, sum(x)=0, sum(|x|) <= gme_limit, |x| <= 1, as an LP in (x+, x-)."""
+    scipy_optimize = pytest.importorskip("scipy.optimize")
+    n = alpha.size
+    result = scipy_optimize.linprog(
+        np.concatenate((-alpha, alpha)),
+        A_ub=np.ones((1, 2 * n)), b_ub=[gme_limit],
+        A_eq=np.concatenate((np.ones(n), -np.ones(n)))[None, :], b_eq=[0.0],
+        bounds=(0.0, 1.0), method="highs",
+    )
+    assert result.status == 0
+    return -result.fun
+
+def qcqp_reference(alpha, variances, risk_budget, gme_limit):
+    """The full problem solved with SLSQP over (x+, x-), from several starting points."""
+    scipy_optimize = pytest.importorskip("scipy.optimize")
+    n = alpha.size
+    constraints = [
+        {"type": "eq", "fun": lambda z: z[:n].sum() - z[n:].sum()},
+        {"type": "ineq", "fun": lambda z: gme_limit - z.sum()},
+        {"type": "ineq", "fun": lambda z: risk_budget ** 2 - np.dot(variances, (z[:n] - z[n:]) ** 2)},
+    ]
+    best = -np.inf
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        result = scipy_optimize.minimize(
+            lambda z: -np.dot(alpha, z[:n] - z[n:]), rng.uniform(0, 0.1, 2 * n),
+            jac=lambda z: np.concatenate((-alpha, alpha)), method="SLSQP",
+            bounds=[(0.0, 1.0)] * (2 * n), constraints=constraints, options={"ftol": 1e-12, "maxiter": 1000},
+        )
+        z = result.x
+        x = z[:n] - z[n:]
+        if (abs(x.sum()) < 1e-7 and np.abs(x).sum() <= gme_limit + 1e-7
+                and np.dot(variances, x * x) <= risk_budget ** 2 + 1e-7):
+            best = max(best, np.dot(alpha, x))
+    return best
+
+def test_boxed_lp_uses_fractional_marginal_positions():
+    alpha = np.array([-1.159, 1.056, -0.257, -1.098, -0.374, -0.543, 0.724, 0.454, -0.28, -0.665, -0.054, 1.325])
+    x = diagonal_weights(alpha, np.full(alpha.size, 0.04), risk_budget=100.0, gme_limit=3.0)
+    np.testing.assert_allclose(x, [-1, 0.5, 0, -0.5, 0, 0, 0, 0, 0, 0, 0, 1], atol=1e-12)
+    assert np.dot(alpha, x) == pytest.approx(lp_optimum(alpha, 3.0), rel=1e-12)
+
+@pytest.mark.parametrize("gme_limit", [0.5, 2.0, 2.5, 3.0, 7.0, 50.0])
+def test_matches_lp_when_risk_is_slack(gme_limit):
+    rng = np.random.default_rng(int(gme_limit * 10))
+    for _ in range(40):
+        n = int(rng.integers(2, 30))
+        alpha = rng.normal(size=n)
+        variances = rng.uniform(0.01, 0.5, n)
+        x = diagonal_weights(alpha, variances, 1e3, gme_limit)
+        assert_feasible(x, variances, 1e3, gme_limit)
+        assert np.dot(alpha, x) == pytest.approx(lp_optimum(alpha, gme_limit), rel=1e-9, abs=1e-12)
+
+@pytest.mark.parametrize("risk_budget, gme_limit", [(0.2, 1.0), (1.0, 1.5), (0.5, 3.0), (1.0, 5.0), (2.0, 4.0)])
+def test_not_worse_than_qcqp_reference(risk_budget, gme_limit):
+    rng = np.random.default_rng(int(risk_budget * 100 + gme_limit))
+    for _ in range(15):
+        n = int(rng.integers(3, 12))
+        alpha = rng.normal(size=n)
+        variances = rng.uniform(0.01, 0.5, n)
+        x = diagonal_weights(alpha, variances, risk_budget, gme_limit)
+        assert_feasible(x, variances, risk_budget, gme_limit)
+        assert np.dot(alpha, x) >= qcqp_reference(alpha, variances, risk_budget, gme_limit) - 1e-7
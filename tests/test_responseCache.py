@@ -0,0 +1,54 @@
+import os
+
+import pytest
+import requests
+
+import scrapeMorningStar
+from conftest import article_page
+from responseCache import ResponseCache
+
+def broken_object(cache, url, damage):
+    entry = cache.lookup(url)
+    path = cache._object_path(entry.digest)
+    if damage == "missing":
+        os.remove(path)
+    else:
+        with open(path, "wb") as f:
+            f.write(b"\x1f\x8b not gzip")
+    return entry
+
+@pytest.mark.parametrize("damage", ["missing", "corrupt"])
+def test_unreadable_object_is_a_miss(tmp_path, damage):
+    with ResponseCache(str(tmp_path)) as cache:
+        cache.store("http://x/a", "article", "alpha")
+        cache.store("http://x/b", "article", "beta")
+        entry = broken_object(cache, "http://x/a", damage)
+
+        assert cache.read(entry) is None
+        assert cache.lookup("http://x/a") is None
+        assert cache.read(cache.lookup("http://x/b")) == "beta"
+
+        # The same body can be stored again afterwards
+        cache.store("http://x/a", "article", "alpha")
+        assert cache.read(cache.lookup("http://x/a")) == "alpha"
+
+@pytest.mark.parametrize("damage", ["missing", "corrupt"])
+def test_fetch_html_refetches_unreadable_object(site, tmp_path, damage):
+    url = site.base_url + "/a"
+    site.routes["/a"] = article_page("alpha")
+    with ResponseCache(str(tmp_path)) as cache:
+        assert "alpha" in scrapeMorningStar.fetch_html(url, "article", cache=cache)
+        broken_object(cache, url, damage)
+
+        assert "alpha" in scrapeMorningStar.fetch_html(url, "article", cache=cache)
+        assert len(site.requests) == 2
+        assert "alpha" in cache.read(cache.lookup(url))
+
+def test_offline_unreadable_object_fails_the_fetch(tmp_path):
+    with ResponseCache(str(tmp_path)) as cache:
+        cache.store("http://x/a", "article", "alpha")
+        broken_object(cache, "http://x/a", "missing")
+        cache.offline = True
+        with pytest.raises(requests.exceptions.ConnectionError):
+            scrapeMorningStar.fetch_html("http://x/a", "article", cache=cache)
+        assert scrapeMorningStar.fetch_article_content("http://x/a", cache=cache) is None
@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+import scrapeMorningStar
+from conftest import article_page
+
+aiohttp = pytest.importorskip("aiohttp")
+
+async def fetch_all(urls, semaphore=None, limiter=None):
+    async with aiohttp.ClientSession() as session:
+        return await asyncio.gather(*(
+            scrapeMorningStar.fetch_text_async(session, url, semaphore=semaphore, limiter=limiter, max_retries=0)
+            for url in urls
+        ))
+
+def test_fetch_text_async_without_semaphore(site):
+    site.routes["/a"] = article_page("alpha")
+    texts = asyncio.run(fetch_all([site.base_url + "/a"]))
+    assert "alpha" in texts[0]
+
+def test_rate_limit_holds_behind_semaphore(site):
+    # The first responses all finish together, freeing both connections at once
+    deadline = []
+
+    def slow():
+        if not deadline:
+            deadline.append(time.monotonic() + 0.6)
+        time.sleep(max(0.0, deadline[0] - time.monotonic()))
+        return 200, article_page("slow")
+
+    for i in range(8):
+        site.routes[f"/slow{i}"] = slow
+    rate = 10.0
+
+    async def run():
+        return await fetch_all([f"{site.base_url}/slow{i}" for i in range(8)],
+                               semaphore=asyncio.Semaphore(2),
+                               limiter=scrapeMorningStar.HostRateLimiter(rate))
+
+    assert all(asyncio.run(run()))
+    starts = sorted(t for t, _ in site.requests)
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    # No burst: consecutive requests stay (almost) 1 / rate apart
+    assert min(gaps) >= 0.8 / rate
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_failed_article_is_retried_on_next_run(site, tmp_path, use_async):
+    site.add_listing(1, [("/a", "Alpha"), ("/b", "Beta")])
+    site.routes["/a"] = article_page("alpha")
+    site.routes["/b"] = lambda: (500, "")
+    output = tmp_path / "articles.csv"
+    state_path = tmp_path / "articles.state"
+
+    def crawl():
+        scrapeMorningStar.scrape_and_append_to_csv(1, 1, str(output), use_async=use_async, max_retries=0,
+                                                   requests_per_second=0, state_path=str(state_path))
+
+    crawl()
+    with scrapeMorningStar.CrawlState(str(state_path)) as state:
+        assert state.finished_pages([1]) == set()
+        assert state.failed_articles() == {site.base_url + "/b"}
+    assert list(pd.read_csv(output)["title"]) == ["Alpha"]
+
+    site.routes["/b"] = article_page("beta")
+    crawl()
+    with scrapeMorningStar.CrawlState(str(state_path)) as state:
+        assert state.finished_pages([1]) == {1}
+        assert state.failed_articles() == set()
+    rows = pd.read_csv(output)
+    assert list(rows["title"]) == ["Alpha", "Beta"]
+    assert list(rows["content"]) == ["alpha", "beta"]
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_csv_and_parquet_store_the_same_rows(site, tmp_path, use_async):
+    pytest.importorskip("pyarrow")
+    from articleSinks import make_sink, read_articles
+
+    # /b is listed again on page 2 while page 1 still sits in the Parquet buffer
+    site.add_listing(1, [("/a", "Alpha"), ("/b", "Beta")])
+    site.add_listing(2, [("/b", "Beta"), ("/c", "Gamma")])
+    for name in "abc":
+        site.routes[f"/{name}"] = article_page(name)
+
+    rows = {}
+    for filename in ("articles.csv", "articles.parquet"):
+        path = str(tmp_path / filename)
+        scrapeMorningStar.scrape_and_append_to_csv(1, 2, path, use_async=use_async, requests_per_second=0,
+                                                   state_path=path + ".state", sink=make_sink(path))
+        rows[filename] = read_articles(path)[["url", "title", "content"]].astype(str).values.tolist()
+
+    assert rows["articles.csv"] == rows["articles.parquet"]
+    assert [row[1] for row in rows["articles.csv"]] == ["Alpha", "Beta", "Gamma"]
+
+# Fixtures every backend must extract identically
+ARTICLE_FIXTURES = {
+    "paragraphs": "<html><body><article><p>one</p><p> two </p><p></p><p>three</p></article></body></html>",
+    "inline markup": "<p>A <b>bold</b> <a href='/x'>link</a></p><p>a<br>b</p>",
+    "script and comment": "<p>a<script>var x = 1;</script><!-- note -->b</p><style>p {}</style>",
+    "entities": "<p>A &amp; B&nbsp;C &pound;5</p>",
+    "template": "<template><p>hidden</p></template><p>shown</p>",
+    "no paragraphs": "<html><body><div>text</div></body></html>",
+    "empty": "",
+}
+
+LISTING_FIXTURES = {
+    "rows": ("<table><tr><th>Title</th></tr>"
+             "<tr><td><a href='/a'>Alpha</a></td><td>Stock Analysis</td><td>Ann</td><td>01/02/2024</td></tr>"
+             "<tr><td>no link</td><td>c</td><td>a</td><td>d</td></tr>"
+             "<tr><td><a href='/b'> Beta <i>plc</i></a></td><td>c</td><td>a</td></tr>"
+             "<tr><td><a name='x'>x</a><a href='/c'>Gamma</a></td><td>c</td><td>a</td><td>d</td><td>e</td></tr>"
+             "</table>"),
+    "template": ("<template><table><tr><td><a href='/t'>T</a></td><td>c</td><td>a</td><td>d</td></tr>"
+                 "</table></template>"),
+    "empty": "",
+}
+
+# Malformed markup that lxml repairs differently, as documented at PARSERS: html.parser output, lxml output
+ARTICLE_DIVERGENCES = {
+    "unclosed p": ("<p>one<p>two<p>three", "onetwothree\n\ntwothree\n\nthree", "one\n\ntwo\n\nthree"),
+    "div in p": ("<p>a<div>b</div>c</p>", "abc", "a"),
+    "table in p": ("<p>x<table><tr><td>1</td></tr></table></p>", "x1", "x"),
+    "cdata": ("<p>x<![CDATA[hidden]]>y</p>", "xhiddeny", "xy"),
+}
+
+@pytest.mark.parametrize("parser", ["strainer", "lxml"])
+@pytest.mark.parametrize("name", sorted(ARTICLE_FIXTURES))
+def test_article_backends_match_html_parser(parser, name):
+    html = ARTICLE_FIXTURES[name]
+    assert scrapeMorningStar.parse_article_html(html, parser) == scrapeMorningStar.parse_article_html(html)
+
+@pytest.mark.parametrize("parser", ["strainer", "lxml"])
+@pytest.mark.parametrize("name", sorted(LISTING_FIXTURES))
+def test_listing_backends_match_html_parser(parser, name):
+    html = LISTING_FIXTURES[name]
+    assert scrapeMorningStar.parse_listing_html(html, parser) == scrapeMorningStar.parse_listing_html(html)
+
+@pytest.mark.parametrize("name", sorted(ARTICLE_DIVERGENCES))
+def test_documented_lxml_divergences(name):
+    html, reference, repaired = ARTICLE_DIVERGENCES[name]
+    assert scrapeMorningStar.parse_article_html(html) == reference
+    assert scrapeMorningStar.parse_article_html(html, "strainer") == reference
+    assert scrapeMorningStar.parse_article_html(html, "lxml") == repaired
+
+def test_unclosed_cells_diverge_under_lxml():
+    html = "<table><tr><td><a href='/x'>T</a><td>c<td>a<td>d</table>"
+    reference = scrapeMorningStar.parse_listing_html(html)[0]
+    assert (reference["collection"], reference["author"]) == ("cad", "ad")
+    repaired = scrapeMorningStar.parse_listing_html(html, "lxml")[0]
+    assert (repaired["collection"], repaired["author"]) == ("c", "a")
+
+def test_article_failing_every_run_is_given_up(site, tmp_path):
+    site.add_listing(1, [("/a", "Alpha"), ("/gone", "Gone")])
+    site.routes["/a"] = article_page("alpha")
+    output = tmp_path / "articles.csv"
+    state_path = str(tmp_path / "articles.state")
+
+    for run in range(3):
+        with scrapeMorningStar.CrawlState(state_path) as state:
+            assert state.finished_pages([1]) == set()
+        scrapeMorningStar.scrape_and_append_to_csv(1, 1, str(output), requests_per_second=0,
+                                                   state_path=state_path, max_article_attempts=3)
+
+    gone = site.base_url + "/gone"
+    with scrapeMorningStar.CrawlState(state_path) as state:
+        assert state.finished_pages([1]) == {1}
+        assert state.failed_articles(given_up=True) == {gone}
+        assert state.known_articles([gone]) == {gone}
+    assert sum(path == "/gone" for _, path in site.requests) == 3
+
+    scrapeMorningStar.scrape_and_append_to_csv(1, 1, str(output), requests_per_second=0, state_path=state_path,
+                                               skip_finished_pages=False)
+    assert sum(path == "/gone" for _, path in site.requests) == 3
+    assert list(pd.read_csv(output)["title"]) == ["Alpha"]
@@ -0,0 +1,182 @@
+import logging
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+from textCleaning import textCleaning
+
+WORDS = "market shares growth revenue margin outlook quarter profit sales guidance".split()
+BOILERPLATE = "Past performance is no guarantee of future results and the value of investments may fall."
+
+@pytest.fixture
+def documents():
+    rng = random.Random(0)
+    # The first document repeats a phrase of its own, so mining it changes the result
+    first = " ".join(["Alpha bravo charlie delta echo foxtrot golf hotel india juliet."] * 30)
+    return [first] + [
+        " ".join(rng.choice(WORDS) for _ in range(40)) + ". " + BOILERPLATE + " "
+        + " ".join(rng.choice(WORDS) for _ in range(20))
+        for _ in range(120)
+    ]
+
+def test_streaming_matches_process_documents(documents):
+    logging.disable(logging.INFO)
+    try:
+        processor = textCleaning()
+        streamed = [result[0] for result in processor.iter_process_documents(iter(documents))]
+        assert streamed == processor.process_documents(documents)
+    finally:
+        logging.disable(logging.NOTSET)
+
+def test_saved_phrase_model_loads_under_another_module_path(documents, tmp_path):
+    logging.disable(logging.INFO)
+    try:
+        # Saved the way runPipeline.py imports it, loaded the way clean/ scripts do
+        path = str(tmp_path / "phrases.pkl")
+        save = ("from clean.textCleaning import DisclaimerPhraseModel as M; "
+                f"m = M().fit({documents[1:30]!r}); m.save({path!r}); print(m.fingerprint)")
+        clean_dir = os.path.join(ROOT, "clean")
+        load = (f"import sys; sys.path.insert(0, {clean_dir!r}); from textCleaning import DisclaimerPhraseModel as M; "
+                f"m = M.load({path!r}); print(m.fingerprint); print(len(m.index.phrases))")
+        saved = subprocess.run([sys.executable, "-c", save], cwd=ROOT, capture_output=True, text=True, check=True)
+        loaded = subprocess.run([sys.executable, "-c", load], cwd=str(tmp_path), capture_output=True, text=True, check=True)
+        fingerprint, compiled = loaded.stdout.split()[-2:]
+        assert fingerprint == saved.stdout.split()[-1]
+        assert int(compiled) > 0
+    finally:
+        logging.disable(logging.NOTSET)
+
+def test_phrase_model_sample_stays_bounded(documents, tmp_path):
+    from textCleaning import DisclaimerPhraseModel
+
+    logging.disable(logging.INFO)
+    try:
+        model = DisclaimerPhraseModel(num_merges=50, sample_size=20).fit(documents[1:21])
+        sizes = []
+        for start in range(21, 121, 20):
+            model.update(documents[start:start + 20])
+            path = tmp_path / "phrases.pkl"
+            model.save(str(path))
+            sizes.append(path.stat().st_size)
+
+        assert model.n_documents == 120
+        assert len(model._unpack(model._sample)) == 20
+        assert max(sizes) < 2 * min(sizes)
+        assert DisclaimerPhraseModel.load(str(path)).sample_size == 20
+        assert any("past_performance" in phrase for phrase in model.phrases)
+    finally:
+        logging.disable(logging.NOTSET)
+
+def reference_merge_most_frequent(documents, num_merges, top_n):
+    """merge_most_frequent as it was before PairMerger: a full recount per merge."""
+    from collections import Counter
+
+    documents = [textCleaning.tokenize(text) for text in documents]
+    for _ in range(num_merges):
+        pair_counts = Counter()
+        for tokens in documents:
+            pair_counts.update(zip(tokens, tokens[1:]))
+        if not pair_counts:
+            break
+        pair, freq = pair_counts.most_common(1)[0]
+        if freq < 2:
+            break
+        merged = f"{pair[0]}_{pair[1]}"
+        updated = []
+        for tokens in documents:
+            out = []
+            i = 0
+            while i < len(tokens):
+                if i < len(tokens) - 1 and (tokens[i], tokens[i + 1]) == pair:
+                    out.append(merged)
+                    i += 2
+                else:
+                    out.append(tokens[i])
+                    i += 1
+            updated.append(out)
+        documents = updated
+    phrases = {token for tokens in documents for token in tokens if "_" in token}
+    return sorted(phrase for phrase in phrases if len(phrase.split("_")) > top_n)
+
+@pytest.mark.parametrize("seed", range(4))
+def test_merge_most_frequent_matches_full_recount(seed):
+    # Small vocabularies give many tied counts and overlapping runs such as "a a a"
+    rng = random.Random(seed)
+    vocabulary = ["a", "b", "c", "d", "e", ".", ","][:3 + seed]
+    documents = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 60))) for _ in range(25)]
+    documents += [BOILERPLATE + " " + document for document in documents[:10]]
+
+    logging.disable(logging.INFO)
+    try:
+        for num_merges, top_n in ((5, 1), (40, 2), (200, 3)):
+            processor = textCleaning(num_merges=num_merges, top_n=top_n)
+            assert processor.merge_most_frequent(documents) == reference_merge_most_frequent(
+                documents, num_merges, top_n)
+    finally:
+        logging.disable(logging.NOTSET)
+
+def reference_clean_document(document, reference_phrases, similarity_threshold):
+    """Disclaimer removal as it was before PhraseIndex: SequenceMatcher on every candidate window."""
+    from difflib import SequenceMatcher
+
+    phrase_dict = {}
+    for phrase in reference_phrases:
+        text = phrase.replace("_", " ")
+        phrase_dict.setdefault(textCleaning.get_first_word(text), []).append(text)
+
+    tokens = textCleaning.tokenize(document)
+    to_remove = set()
+    removed_texts = []
+    for i in range(len(tokens)):
+        first_word = textCleaning.get_first_word(" ".join(tokens[i:]))
+        if first_word not in phrase_dict:
+            continue
+        for phrase in phrase_dict[first_word]:
+            length = len(phrase.split())
+            if i + length > len(tokens):
+                continue
+            window = " ".join(tokens[i:i + length])
+            if SequenceMatcher(None, window, phrase).ratio() >= similarity_threshold:
+                to_remove.update(range(i, i + length))
+                removed_texts.append(window)
+                break
+
+    cleaned = [token for i, token in enumerate(tokens) if i not in to_remove]
+    ratio = len(cleaned) / len(tokens) if tokens else 0
+    return " ".join(cleaned), sum(len(text) for text in removed_texts), ratio
+
+def typo(text, rng):
+    position = rng.randrange(len(text))
+    return text[:position] + rng.choice("xyz ") + text[position + 1:]
+
+@pytest.mark.parametrize("similarity_threshold", [0.8, 0.95, 1.0])
+def test_phrase_index_matches_sequence_matcher_scan(similarity_threshold):
+    from textCleaning import PhraseIndex, clean_document
+
+    rng = random.Random(7)
+    phrases = ["past_performance_is_no_guarantee_of_future_results",
+               "the_value_of_investments_may_fall",
+               "this_report_is_for_information_only_.",
+               "past_results_are_not_indicative",
+               "morningstar_,_inc_._all_rights_reserved"]
+    sentences = [phrase.replace("_", " ") for phrase in phrases]
+    documents = []
+    for _ in range(60):
+        parts = []
+        for _ in range(rng.randint(0, 6)):
+            choice = rng.random()
+            if choice < 0.4:
+                parts.append(rng.choice(sentences))
+            elif choice < 0.7:
+                parts.append(typo(rng.choice(sentences), rng))
+            else:
+                parts.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))))
+        documents.append(" ".join(parts))
+
+    index = PhraseIndex(phrases, similarity_threshold)
+    for document in documents:
+        assert clean_document(document, index) == reference_clean_document(document, phrases, similarity_threshold)